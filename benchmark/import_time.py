@@ -0,0 +1,77 @@
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+"""
+Measures the cold-start latency of ``from utils.challenge_2023 import
+ChallengeSampling``, i.e. the time every evaluator worker and test process spends
+before it can create a ChallengeSampling.
+
+Each measurement runs in a fresh interpreter, so nothing is cached in
+sys.modules. The script also lists the heavy packages which are loaded by the
+import; the framework converters and the hardware-specific transpilers should
+only be loaded on first use.
+
+Run ``python -X importtime -c "from utils.challenge_2023 import ChallengeSampling"``
+in the root directory for a per-module breakdown.
+"""
+
+n_runs = 10
+
+heavy_modules = [
+    "qiskit",
+    "cirq",
+    "scipy",
+    "qulacs",
+    "openfermion",
+    "quri_parts.qiskit",
+    "quri_parts.cirq",
+    "quri_parts.qulacs",
+    "quri_parts.quantinuum",
+    "quri_parts.algo.mitigation.zne",
+    "utils.challenge_transpiler",
+    "utils.sc_routing",
+]
+
+measure_code = f"""
+import json, sys, time
+start = time.perf_counter()
+from utils.challenge_2023 import ChallengeSampling
+elapsed = time.perf_counter() - start
+loaded = [m for m in {heavy_modules!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+"""
+
+
+def measure() -> tuple[float, list[str]]:
+    output = subprocess.run(
+        [sys.executable, "-c", measure_code],
+        cwd="../",
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output)
+    return float(result["elapsed"]), list(result["loaded"])
+
+
+def main() -> None:
+    # the first run warms up the file system cache and the bytecode cache
+    measure()
+    elapsed_times = np.zeros(n_runs)
+    for i in range(n_runs):
+        elapsed, loaded = measure()
+        elapsed_times[i] = elapsed * 1e3
+
+    print(f"from utils.challenge_2023 import ChallengeSampling ({n_runs} runs)")
+    print(
+        f"  median {np.median(elapsed_times):.1f} ms, "
+        f"min {elapsed_times.min():.1f} ms, max {elapsed_times.max():.1f} ms"
+    )
+    print(f"  heavy modules loaded: {', '.join(loaded) if loaded else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
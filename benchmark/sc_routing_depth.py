@@ -0,0 +1,105 @@
+import sys
+from collections.abc import Iterable, Iterator, Sequence
+from time import perf_counter
+
+import numpy as np
+from openfermion.transforms import jordan_wigner
+from openfermion.utils import load_operator
+
+from quri_parts.algo.ansatz import HardwareEfficientReal, SymmetryPreservingReal
+from quri_parts.circuit import NonParametricQuantumCircuit, QuantumCircuit
+from quri_parts.circuit.transpile import CircuitTranspiler
+from quri_parts.core.measurement import bitwise_commuting_pauli_measurement
+from quri_parts.openfermion.ansatz import KUpCCGSD, TrotterSingletUCCSD
+from quri_parts.openfermion.operator import operator_from_openfermion_op
+
+sys.path.append("../")
+from utils.challenge_transpiler import (
+    SCDepthAwareSquareLatticeTranspiler,
+    SCSquareLatticeTranspiler,
+)
+
+"""
+Compares the depth of circuits transpiled for the "sc" hardware with the default
+SquareLatticeSWAPInsertionTranspiler and with DepthAwareSquareLatticeRouter.
+
+The charged quantum circuit time of a shot is proportional to the depth, so the
+ratio of the depths is the ratio of the charged times.
+"""
+
+n_qubits = 8
+rng = np.random.default_rng(0)
+
+
+def ansatz_circuits() -> Iterator[tuple[str, NonParametricQuantumCircuit]]:
+    hf_gates = QuantumCircuit(n_qubits)
+    for i in range(n_qubits // 2):
+        hf_gates.add_X_gate(i)
+
+    ansatze = {
+        "HardwareEfficientReal(reps=1)": HardwareEfficientReal(n_qubits, reps=1),
+        "HardwareEfficientReal(reps=4)": HardwareEfficientReal(n_qubits, reps=4),
+        "SymmetryPreservingReal(reps=2)": SymmetryPreservingReal(n_qubits, reps=2),
+        "TrotterSingletUCCSD": TrotterSingletUCCSD(n_qubits, n_qubits // 2),
+        "KUpCCGSD(k=1)": KUpCCGSD(n_qubits, n_qubits // 2, k=1),
+    }
+    for name, ansatz in ansatze.items():
+        params = rng.random(ansatz.parameter_count)
+        yield name, hf_gates + ansatz.bind_parameters(list(params))
+
+
+def measurement_circuits(
+    state_circuit: NonParametricQuantumCircuit, hamiltonian_name: str
+) -> Iterator[NonParametricQuantumCircuit]:
+    ham = load_operator(
+        file_name=hamiltonian_name,
+        data_directory="../hamiltonian/hamiltonian_samples",
+        plain_text=False,
+    )
+    hamiltonian = operator_from_openfermion_op(jordan_wigner(ham))
+    for measurement in bitwise_commuting_pauli_measurement(hamiltonian):
+        yield state_circuit + measurement.measurement_circuit
+
+
+def transpile(
+    transpiler: CircuitTranspiler, circuits: Iterable[NonParametricQuantumCircuit]
+) -> tuple[Sequence[int], float]:
+    start = perf_counter()
+    depths = [transpiler(circuit).depth for circuit in circuits]
+    return depths, perf_counter() - start
+
+
+def main() -> None:
+    default = SCSquareLatticeTranspiler()
+    depth_aware = SCDepthAwareSquareLatticeTranspiler()
+
+    print(f"{'circuit':<34}{'default':>10}{'depth-aware':>14}{'ratio':>8}")
+    # the elapsed time of the depth-aware transpiler includes the routing
+    for name, circuit in ansatz_circuits():
+        (d_default,), _ = transpile(default, [circuit])
+        (d_aware,), elapsed = transpile(depth_aware, [circuit])
+        print(
+            f"{name:<34}{d_default:>10}{d_aware:>14}{d_aware / d_default:>8.2f}"
+            f"  ({elapsed:.2f} s)"
+        )
+
+    print()
+    print("Total depth of the measurement circuits of KUpCCGSD(k=1)")
+    _, circuit = list(ansatz_circuits())[-1]
+    for i in range(1, 6):
+        hamiltonian_name = f"{n_qubits}_qubits_H_{i}"
+        circuits = list(measurement_circuits(circuit, hamiltonian_name))
+        depths_default, elapsed_default = transpile(default, circuits)
+        # the measurement circuits share the cached routing of the ansatz
+        depths_aware, elapsed_aware = transpile(depth_aware, circuits)
+        total_default, total_aware = sum(depths_default), sum(depths_aware)
+        print(
+            f"{hamiltonian_name:<34}{total_default:>10}{total_aware:>14}"
+            f"{total_aware / total_default:>8.2f}"
+            f"  ({len(circuits)} circuits, {elapsed_default:.2f} s"
+            f" / {elapsed_aware:.2f} s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,16 @@ add codes here
 
 
 class RunAlgorithm:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        hamiltonian_file: str = "8_qubits_H",
+        hamiltonian_directory: str = "../hamiltonian",
+    ) -> None:
+        """The Hamiltonian to solve is ``hamiltonian_file`` in
+        ``hamiltonian_directory``, which evaluator.py also uses for the reference
+        value."""
+        self.hamiltonian_file = hamiltonian_file
+        self.hamiltonian_directory = hamiltonian_directory
         challenge_sampling.reset()
 
     def result_for_evaluation(self) -> tuple[Any, float]:
@@ -1,3 +1,4 @@
+import inspect
 import numpy as np
 import sys
 import traceback
@@ -6,16 +7,41 @@ from typing import Optional
 
 from example import RunAlgorithm
 
+sys.path.append("../")
+from utils.reference_energy import reference_energy
+
 num_exec = 1
-ref_value = -8.42442890089805  #: reference value of 8 qubits
+hamiltonian_file = "8_qubits_H"  #: Hamiltonian passed to RunAlgorithm
+hamiltonian_directory = "../hamiltonian"
 
 """
+The reference value is the exact ground state energy of the Hamiltonian at half
+filling, computed and cached by utils/reference_energy.py. Another Hamiltonian
+can be evaluated with
+    python evaluator.py [hamiltonian_file [hamiltonian_directory]]
 reference values (n_qubits: reference_value)
 4: -4, 
 8: -8.42442890089805, 
 """
 
 
+def create_run_algorithm() -> RunAlgorithm:
+    """
+    Passes the Hamiltonian to RunAlgorithm if its constructor accepts it, as the
+    one of example.py does. RunAlgorithm of the original answer template takes no
+    arguments and solves its own Hamiltonian.
+    """
+    try:
+        inspect.signature(RunAlgorithm).bind(hamiltonian_file, hamiltonian_directory)
+    except TypeError:
+        print(
+            "RunAlgorithm() takes no Hamiltonian, make sure that it solves "
+            f"{hamiltonian_file} in {hamiltonian_directory}"
+        )
+        return RunAlgorithm()
+    return RunAlgorithm(hamiltonian_file, hamiltonian_directory)
+
+
 class EvaluateResults:
     def __init__(self) -> None:
         self.qc_time_history: list[float] = []
@@ -26,9 +52,11 @@ class EvaluateResults:
         """
         :return: Grade point of the algorithm.
         """
+        ref_value = reference_energy(hamiltonian_file, hamiltonian_directory)
+        print(f"Reference energy of {hamiltonian_file} = {ref_value}")
         for n in range(n_run):
             print(f"Running algorithm({n+1})..")
-            run_algorithm = RunAlgorithm()
+            run_algorithm = create_run_algorithm()
             try:
                 energy, qc_time = run_algorithm.result_for_evaluation()
                 ans = abs(ref_value - energy)
@@ -48,17 +76,22 @@ class EvaluateResults:
                 for l_ in traceback_message:
                     print(l_.strip("\n"))
                 return 0
-        result_ave = np.average(self.result_history)
-        self.points = 1 / result_ave
+        result_ave = float(np.average(self.result_history))
+        points = 1 / result_ave
+        self.points = points
         print("\n############## Final Result ##############")
         print(f"Average accuracy = {result_ave}")
-        print(f"Final point = {np.round(self.points, 8)}")
+        print(f"Final point = {np.round(points, 8)}")
         print("##########################################")
 
-        return self.points
+        return points
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        hamiltonian_file = sys.argv[1]
+    if len(sys.argv) > 2:
+        hamiltonian_directory = sys.argv[2]
     point_eval = EvaluateResults()
     point_eval.get_point(n_run=num_exec)
     print(f"Algorithm points: {point_eval.points}")
@@ -3,7 +3,7 @@ from typing import Any
 
 import numpy as np
 from openfermion.transforms import jordan_wigner
-from openfermion.utils import load_operator
+from openfermion.utils import count_qubits, load_operator
 
 from quri_parts.algo.ansatz import HardwareEfficientReal
 from quri_parts.algo.optimizer import Adam, OptimizerStatus
@@ -63,7 +63,13 @@ def vqe(hamiltonian, parametric_state, estimator, init_params, optimizer):
 
 
 class RunAlgorithm:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        hamiltonian_file: str = "8_qubits_H",
+        hamiltonian_directory: str = "../hamiltonian",
+    ) -> None:
+        self.hamiltonian_file = hamiltonian_file
+        self.hamiltonian_directory = hamiltonian_directory
         challenge_sampling.reset()
 
     def result_for_evaluation(self) -> tuple[Any, float]:
@@ -73,18 +79,18 @@ class RunAlgorithm:
         return energy_final, qc_time_final
 
     def get_result(self) -> Any:
-        n_site = 4
-        n_qubits = 2 * n_site
         ham = load_operator(
-            file_name=f"{n_qubits}_qubits_H",
-            data_directory="../hamiltonian",
+            file_name=self.hamiltonian_file,
+            data_directory=self.hamiltonian_directory,
             plain_text=False,
         )
+        n_qubits = count_qubits(ham)
         jw_hamiltonian = jordan_wigner(ham)
         hamiltonian = operator_from_openfermion_op(jw_hamiltonian)
 
-        # make hf + HEreal ansatz
-        hf_gates = ComputationalBasisState(n_qubits, bits=0b00001111).circuit.gates
+        # make hf + HEreal ansatz at half filling
+        hf_bits = (1 << n_qubits // 2) - 1
+        hf_gates = ComputationalBasisState(n_qubits, bits=hf_bits).circuit.gates
         hf_circuit = LinearMappedUnboundParametricQuantumCircuit(n_qubits).combine(hf_gates)
         hw_ansatz = HardwareEfficientReal(qubit_count=n_qubits, reps=1)
         hf_circuit.extend(hw_ansatz)
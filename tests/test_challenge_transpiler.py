@@ -0,0 +1,89 @@
+import numpy as np
+import numpy.typing as npt
+import pytest
+from qulacs import QuantumState
+from quri_parts.circuit import NonParametricQuantumCircuit, QuantumCircuit
+from quri_parts.quantinuum.circuit.transpile import QuantinuumSetTranspiler
+from quri_parts.qulacs.circuit import convert_gate
+
+from utils.challenge_transpiler import (
+    QuantinuumPeepholeTranspiler,
+    convert_iontrap_native_gate,
+)
+
+
+def random_circuit(rng: np.random.Generator) -> QuantumCircuit:
+    qubit_count = int(rng.integers(1, 6))
+    circuit = QuantumCircuit(qubit_count)
+    for _ in range(int(rng.integers(1, 30))):
+        name = rng.choice(["H", "RX", "RY", "RZ", "X", "Identity", "CNOT", "CZ", "RZZ"])
+        angle = float(rng.choice([rng.uniform(-np.pi, np.pi), np.pi / 2, np.pi]))
+        qubit = int(rng.integers(qubit_count))
+        if name in ["CNOT", "CZ", "RZZ"]:
+            if qubit_count < 2:
+                continue
+            qubit, other = (int(q) for q in rng.choice(qubit_count, 2, replace=False))
+            if name == "CNOT":
+                circuit.add_CNOT_gate(qubit, other)
+            elif name == "CZ":
+                circuit.add_CZ_gate(qubit, other)
+            else:
+                circuit.add_PauliRotation_gate([qubit, other], [3, 3], angle)
+        elif name == "H":
+            circuit.add_H_gate(qubit)
+        elif name == "X":
+            circuit.add_X_gate(qubit)
+        elif name == "Identity":
+            circuit.add_Identity_gate(qubit)
+        elif name == "RX":
+            circuit.add_RX_gate(qubit, angle)
+        elif name == "RY":
+            circuit.add_RY_gate(qubit, angle)
+        else:
+            circuit.add_RZ_gate(qubit, angle)
+    return circuit
+
+
+def native_unitary(circuit: NonParametricQuantumCircuit) -> npt.NDArray[np.complex128]:
+    dim = 2**circuit.qubit_count
+    gates = [
+        convert_iontrap_native_gate(gate)
+        if gate.name in ["U1q", "ZZ", "RZZ"]
+        else convert_gate(gate)
+        for gate in circuit.gates
+    ]
+    unitary = np.zeros((dim, dim), dtype=complex)
+    for i in range(dim):
+        state = QuantumState(circuit.qubit_count)
+        state.set_computational_basis(i)
+        for gate in gates:
+            gate.update_quantum_state(state)
+        unitary[:, i] = state.get_vector()
+    return unitary
+
+
+def equal_up_to_global_phase(
+    a: npt.NDArray[np.complex128], b: npt.NDArray[np.complex128]
+) -> bool:
+    overlap = np.vdot(a.flatten(), b.flatten())
+    return bool(np.isclose(abs(overlap), a.shape[0], atol=1e-8))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_peephole_is_unitary_equivalent(seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    for _ in range(50):
+        native = QuantinuumSetTranspiler()(random_circuit(rng))
+        optimized = QuantinuumPeepholeTranspiler()(native)
+        assert equal_up_to_global_phase(
+            native_unitary(native), native_unitary(optimized)
+        )
+        assert optimized.depth <= native.depth
+
+
+def test_peephole_cancels_inverse_zz() -> None:
+    circuit = QuantumCircuit(2)
+    circuit.add_PauliRotation_gate([0, 1], [3, 3], 0.3)
+    circuit.add_PauliRotation_gate([0, 1], [3, 3], -0.3)
+    optimized = QuantinuumPeepholeTranspiler()(QuantinuumSetTranspiler()(circuit))
+    assert optimized.depth == 0
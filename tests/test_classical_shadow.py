@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from quri_parts.circuit import QuantumCircuit
+from quri_parts.core.operator import Operator, pauli_label
+from quri_parts.core.state import GeneralCircuitQuantumState
+
+from utils.classical_shadow import classical_shadow_estimate_gc, covering_bases
+from utils.measurement_counts import create_array_vector_concurrent_sampler
+
+
+def plus_state(qubit_count: int) -> GeneralCircuitQuantumState:
+    circuit = QuantumCircuit(qubit_count)
+    for qubit in range(qubit_count):
+        circuit.add_H_gate(qubit)
+    return GeneralCircuitQuantumState(qubit_count, circuit)
+
+
+def test_covering_bases_match_every_string() -> None:
+    rng = np.random.default_rng(0)
+    paulis = rng.integers(0, 4, size=(50, 6), dtype=np.uint8)
+    bases = covering_bases(paulis, rng)
+    assert len(bases) < len(paulis)
+    assert set(bases.flatten().tolist()) <= {1, 2, 3}
+    support = paulis > 0
+    matches = np.all(~support | (paulis == bases[:, None, :]), axis=2)
+    assert matches.any(axis=0).all()
+
+    # bitwise commuting strings share a basis
+    paulis = np.array([[3, 0, 0], [0, 3, 0], [3, 3, 1]], dtype=np.uint8)
+    assert covering_bases(paulis, rng).tolist() == [[3, 3, 1]]
+
+
+def test_terms_missed_by_the_random_bases_are_measured() -> None:
+    op = Operator(
+        {
+            pauli_label("X0 X1 X2 X3 X4 X5"): 1.0,
+            pauli_label("Y0 Y1 Y2 Y3 Y4 Y5"): 0.5,
+            pauli_label("Z0 Z1 Z2 Z3 Z4 Z5"): 0.5,
+        }
+    )
+    estimate, circuit_and_shots = classical_shadow_estimate_gc(
+        op,
+        plus_state(6),
+        3000,
+        1,
+        create_array_vector_concurrent_sampler(),
+        "sc",
+        rng=np.random.default_rng(0),
+    )
+    # <XXXXXX> = 1 and <YYYYYY> = <ZZZZZZ> = 0
+    assert len(list(circuit_and_shots)) > 1
+    assert estimate.error < 0.05
+    assert estimate.value.real == pytest.approx(1.0, abs=5 * estimate.error)
+
+
+def test_unmatched_terms_add_their_bias_to_the_error() -> None:
+    op = Operator({pauli_label("X0"): 1.0, pauli_label("Z0"): 0.5})
+    estimate, circuit_and_shots = classical_shadow_estimate_gc(
+        op,
+        plus_state(1),
+        1,
+        1,
+        create_array_vector_concurrent_sampler(),
+        "sc",
+        rng=np.random.default_rng(0),
+    )
+    # a single shot measures only one of the two bases
+    assert len(list(circuit_and_shots)) == 1
+    assert estimate.error >= 0.5
+
+
+@pytest.mark.parametrize("total_shots, n_bases", [(0, 10), (100, 0), (-1, 10)])
+def test_invalid_shots_and_bases(total_shots: int, n_bases: int) -> None:
+    with pytest.raises(ValueError):
+        classical_shadow_estimate_gc(
+            Operator({pauli_label("Z0"): 1.0}),
+            plus_state(1),
+            total_shots,
+            n_bases,
+            create_array_vector_concurrent_sampler(),
+            "sc",
+        )
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from quri_parts.core.estimator.sampling.estimator import _Estimate
+from quri_parts.core.measurement import (
+    CommutablePauliSetMeasurementTuple,
+    PauliReconstructor,
+    bitwise_commuting_pauli_measurement,
+    bitwise_pauli_reconstructor_factory,
+)
+from quri_parts.core.operator import PAULI_IDENTITY, Operator, PauliLabel, pauli_label
+
+from utils.measurement_counts import ArrayMeasurementCounts
+from utils.sampling_estimator import _estimate_from_counts
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_estimate_from_counts_matches_quri_parts(seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    op = Operator(
+        {
+            PAULI_IDENTITY: 0.7,
+            pauli_label("Z0 Z1"): 0.5,
+            pauli_label("X0 X2"): -0.3,
+            pauli_label("Y1 Y3"): 0.2j,
+            pauli_label("Z3"): 1.1,
+        }
+    )
+    measurements = [
+        m
+        for m in bitwise_commuting_pauli_measurement(op)
+        if m.pauli_set != {PAULI_IDENTITY}
+    ]
+    counts = [
+        ArrayMeasurementCounts.from_samples(rng.integers(0, 16, 500))
+        for _ in measurements
+    ]
+    expected = _Estimate(
+        op,
+        0.7,
+        [m.pauli_set for m in measurements],
+        [m.pauli_reconstructor_factory for m in measurements],
+        [dict(c.items()) for c in counts],
+    )
+
+    estimate = _estimate_from_counts(op, 0.7, measurements, counts)
+    assert estimate.value == pytest.approx(expected.value)
+    assert estimate.error == pytest.approx(expected.error)
+
+    # reconstructors other than the bitwise one are called for each bitstring
+    def factory(pauli: PauliLabel) -> PauliReconstructor:
+        return bitwise_pauli_reconstructor_factory(pauli)
+
+    wrapped = [
+        CommutablePauliSetMeasurementTuple(m.pauli_set, m.measurement_circuit, factory)
+        for m in measurements
+    ]
+    estimate = _estimate_from_counts(op, 0.7, wrapped, counts)
+    assert estimate.value == pytest.approx(expected.value)
+    assert estimate.error == pytest.approx(expected.error)
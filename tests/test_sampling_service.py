@@ -0,0 +1,75 @@
+import threading
+from collections.abc import Iterator
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from pathlib import Path
+
+import pytest
+from quri_parts.circuit import QuantumCircuit
+
+from utils.sampling_service import (
+    ChallengeSamplingClient,
+    SamplingServer,
+    _parse_address,
+)
+
+AUTHKEY = b"test-key"
+
+
+@pytest.fixture
+def server(tmp_path: Path) -> Iterator[SamplingServer]:
+    server = SamplingServer(
+        str(tmp_path / "sampling.sock"), authkey=AUTHKEY, noise=False, max_workers=1
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.close()
+
+
+def test_clients_are_charged_separately(server: SamplingServer) -> None:
+    circuit = QuantumCircuit(2)
+    circuit.add_H_gate(0)
+    circuit.add_CNOT_gate(0, 1)
+
+    first = ChallengeSamplingClient(server.address, authkey=AUTHKEY)
+    second = ChallengeSamplingClient(server.address, authkey=AUTHKEY)
+    try:
+        counts = first.sampler(circuit, 100, "sc")
+        assert sum(counts.values()) == 100
+        assert set(counts) <= {0, 3}
+        assert (first.total_shots, first.total_jobs) == (100, 1)
+        assert first.total_quantum_circuit_time > 0
+
+        second.sampler(circuit, 10, "sc")
+        second.sampler(circuit, 10, "it")
+        assert (second.total_shots, second.total_jobs) == (20, 2)
+        # the first client is not charged for the jobs of the second one
+        first.sampler(circuit, 1, "sc")
+        assert (first.total_shots, first.total_jobs) == (101, 2)
+
+        with pytest.raises(ValueError, match="Unknown job"):
+            first._run_jobs([("no_such_job", ())])
+        assert first.total_jobs == 2
+    finally:
+        first.close()
+        second.close()
+
+
+def test_wrong_authkey_is_rejected(server: SamplingServer) -> None:
+    with pytest.raises(AuthenticationError):
+        Client(server.address, authkey=b"wrong-key")
+    # the server keeps accepting clients
+    client = ChallengeSamplingClient(server.address, authkey=AUTHKEY)
+    client.close()
+
+
+def test_parse_address_accepts_only_local_addresses() -> None:
+    assert _parse_address("/tmp/qagc.sock") == "/tmp/qagc.sock"
+    assert _parse_address("localhost:5000") == ("localhost", 5000)
+    assert _parse_address("127.0.0.1:5000") == ("127.0.0.1", 5000)
+    with pytest.raises(ValueError):
+        _parse_address("0.0.0.0:5000")
+    with pytest.raises(ValueError):
+        _parse_address("192.168.0.1:5000")
+    with pytest.raises(ValueError):
+        SamplingServer(("0.0.0.0", 0), authkey=AUTHKEY)
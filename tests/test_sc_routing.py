@@ -0,0 +1,132 @@
+import itertools
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+import pytest
+from quri_parts.circuit import NonParametricQuantumCircuit, QuantumCircuit
+from quri_parts.core.state import GeneralCircuitQuantumState
+from quri_parts.qulacs.simulator import evaluate_state_to_vector
+
+from utils import sc_routing
+from utils.sc_routing import DepthAwareSquareLatticeRouter
+
+
+@pytest.fixture(autouse=True)
+def empty_layout_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(sc_routing, "_layout_cache", OrderedDict())
+
+
+def random_circuit(
+    rng: np.random.Generator, qubit_count: int, angles: Optional[Sequence[float]] = None
+) -> QuantumCircuit:
+    circuit = QuantumCircuit(qubit_count)
+    for k in range(30):
+        qubit, other = (int(q) for q in rng.choice(qubit_count, 2, replace=False))
+        angle = float(rng.uniform(-np.pi, np.pi))
+        circuit.add_RY_gate(qubit, angles[k] if angles is not None else angle)
+        name = rng.choice(["CNOT", "CZ", "SWAP", "H"])
+        if name == "CNOT":
+            circuit.add_CNOT_gate(qubit, other)
+        elif name == "CZ":
+            circuit.add_CZ_gate(qubit, other)
+        elif name == "SWAP":
+            circuit.add_SWAP_gate(qubit, other)
+        else:
+            circuit.add_H_gate(other)
+    return circuit
+
+
+def state_vector(circuit: NonParametricQuantumCircuit) -> npt.NDArray[np.complex128]:
+    state = GeneralCircuitQuantumState(circuit.qubit_count, circuit)
+    return evaluate_state_to_vector(state).vector
+
+
+def fits_lattice(circuit: NonParametricQuantumCircuit, xsize: int, ysize: int) -> bool:
+    """Whether the qubits of a circuit can be placed on the lattice sites so that
+    all two-qubit gates act on adjacent sites."""
+    pairs = {
+        tuple(gate.control_indices) + tuple(gate.target_indices)
+        for gate in circuit.gates
+        if len(gate.control_indices) + len(gate.target_indices) == 2
+    }
+    for sites in itertools.permutations(range(xsize * ysize), circuit.qubit_count):
+        coords = [divmod(s, xsize) for s in sites]
+        if all(
+            abs(coords[a][0] - coords[b][0]) + abs(coords[a][1] - coords[b][1]) == 1
+            for a, b in pairs
+        ):
+            return True
+    return False
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_routed_circuit_prepares_the_same_state(seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    for qubit_count in range(2, 6):
+        circuit = random_circuit(rng, qubit_count)
+        routed = DepthAwareSquareLatticeRouter(xsize=3, ysize=2)(circuit)
+        # the output qubits are relabeled with the logical qubits ending on them
+        overlap = np.vdot(state_vector(circuit), state_vector(routed))
+        assert abs(overlap) == pytest.approx(1.0)
+        assert fits_lattice(routed, 3, 2)
+
+
+@pytest.fixture
+def routings(monkeypatch: pytest.MonkeyPatch) -> list[object]:
+    """Records the circuits routed, i.e. not found in the layout cache."""
+    calls: list[object] = []
+    route_best = DepthAwareSquareLatticeRouter._route_best
+
+    def recording_route_best(
+        self: DepthAwareSquareLatticeRouter, *args: object
+    ) -> object:
+        calls.append(args)
+        return route_best(self, *args)  # type: ignore[arg-type]
+
+    monkeypatch.setattr(
+        DepthAwareSquareLatticeRouter, "_route_best", recording_route_best
+    )
+    return calls
+
+
+def test_layout_is_cached_by_structure(routings: list[object]) -> None:
+    circuit = random_circuit(np.random.default_rng(0), 4)
+    routed = DepthAwareSquareLatticeRouter()(circuit)
+    assert len(routings) == 1
+
+    # the same structure with other angles and trailing single-qubit gates
+    rebound = random_circuit(np.random.default_rng(0), 4, angles=[0.1] * 30)
+    rebound.add_H_gate(0)
+    routed_rebound = DepthAwareSquareLatticeRouter()(rebound)
+    assert len(routings) == 1
+    assert [(g.name, g.target_indices, g.control_indices) for g in routed.gates] == [
+        (g.name, g.target_indices, g.control_indices) for g in routed_rebound.gates
+    ][:-1]
+    overlap = np.vdot(state_vector(rebound), state_vector(routed_rebound))
+    assert abs(overlap) == pytest.approx(1.0)
+
+    # the lattice and the lookahead are part of the key
+    DepthAwareSquareLatticeRouter(xsize=4, ysize=4)(circuit)
+    DepthAwareSquareLatticeRouter(lookahead=5)(circuit)
+    assert len(routings) == 3
+
+
+def test_layout_cache_evicts_least_recently_used(
+    monkeypatch: pytest.MonkeyPatch, routings: list[object]
+) -> None:
+    monkeypatch.setattr(sc_routing, "_LAYOUT_CACHE_SIZE", 2)
+    router = DepthAwareSquareLatticeRouter()
+    circuits = [random_circuit(np.random.default_rng(seed), 4) for seed in range(3)]
+    for i in [0, 1, 0, 2]:
+        router(circuits[i])
+    assert len(routings) == 3
+    assert len(sc_routing._layout_cache) == 2
+
+    # circuit 1 was evicted, circuit 0 was kept since it was used after it
+    router(circuits[0])
+    assert len(routings) == 3
+    router(circuits[1])
+    assert len(routings) == 4
@@ -0,0 +1,382 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Collection, Iterable
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Optional, Sequence, TypeVar, Union
+
+from quri_parts.core.estimator import Estimatable, Estimate
+from quri_parts.core.measurement import CommutablePauliSetMeasurementFactory
+from quri_parts.core.sampling import MeasurementCounts, PauliSamplingShotsAllocator
+from quri_parts.core.state import CircuitQuantumState, ParametricCircuitQuantumState
+
+from utils.challenge_2023 import ChallengeSampling, QPQiskitCircuit, QPQiskitOperator
+
+T = TypeVar("T")
+
+#: An awaitable counterpart of :class:`~Sampler`.
+AsyncSampler = Callable[[QPQiskitCircuit, int], Awaitable[MeasurementCounts]]
+
+#: An awaitable counterpart of :class:`~ConcurrentSampler`.
+AsyncConcurrentSampler = Callable[
+    [Iterable[tuple[QPQiskitCircuit, int]]], Awaitable[Iterable[MeasurementCounts]]
+]
+
+#: An awaitable counterpart of :class:`~QuantumEstimator`.
+AsyncQuantumEstimator = Callable[
+    [Estimatable, CircuitQuantumState], Awaitable[Estimate[complex]]
+]
+
+#: An awaitable counterpart of :class:`~ConcurrentQuantumEstimator`.
+AsyncConcurrentQuantumEstimator = Callable[
+    [Sequence[Estimatable], Sequence[CircuitQuantumState]],
+    Awaitable[Iterable[Estimate[complex]]],
+]
+
+#: An awaitable counterpart of :class:`~ParametricQuantumEstimator`.
+AsyncParametricQuantumEstimator = Callable[
+    [Estimatable, ParametricCircuitQuantumState, Sequence[float]],
+    Awaitable[Estimate[complex]],
+]
+
+#: An awaitable counterpart of :class:`~ConcurrentParametricQuantumEstimator`.
+AsyncConcurrentParametricQuantumEstimator = Callable[
+    [Estimatable, ParametricCircuitQuantumState, Sequence[Sequence[float]]],
+    Awaitable[Iterable[Estimate[complex]]],
+]
+
+
+class AsyncChallengeSampling:
+    """Asyncio-native counterpart of :class:`ChallengeSampling`.
+
+    Simulations run on ``executor`` (the default executor of the running event
+    loop if omitted) while accounting is performed on the event loop under an
+    :class:`asyncio.Lock`, so that concurrent jobs are charged one at a time to
+    the wrapped :class:`ChallengeSampling` and :class:`TimeExceededError` is
+    raised consistently: once the budget is exhausted every pending and every
+    later job raises it.
+
+    A job which is cancelled or times out before its result is delivered is not
+    charged. Note that a simulation that has already started on a thread cannot
+    be interrupted and keeps running in the background until it finishes.
+
+    The public hardware attributes of the wrapped :class:`ChallengeSampling`
+    (:attr:`transpiler`, :attr:`transpiled_circuit`, ...) are set on the event
+    loop when a job delivers its result, not by the simulation threads.
+
+    Args:
+        challenge_sampling: A :class:`ChallengeSampling` that holds the accounting.
+        executor: An :class:`~concurrent.futures.Executor` whose workers are
+            threads of this process, e.g. a
+            :class:`~concurrent.futures.ThreadPoolExecutor`. Process pools are not
+            supported, since the measurement factories and shots allocators are
+            closures in general, which can not be pickled; use
+            :class:`~utils.sampling_service.ChallengeSamplingClient` to run the
+            simulations in other processes.
+    """
+
+    def __init__(
+        self,
+        challenge_sampling: ChallengeSampling,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.challenge_sampling = challenge_sampling
+        self._executor = executor
+        self._lock = asyncio.Lock()
+
+    @property
+    def total_shots(self) -> int:
+        return self.challenge_sampling.total_shots
+
+    @property
+    def total_jobs(self) -> int:
+        return self.challenge_sampling.total_jobs
+
+    @property
+    def total_quantum_circuit_time(self) -> float:
+        return self.challenge_sampling.total_quantum_circuit_time
+
+    async def _run(self, fn: Callable[[], T], timeout: Optional[float]) -> T:
+        async with self._lock:
+            self.challenge_sampling._check_time()
+        thread_state = self.challenge_sampling._thread_state
+
+        def job() -> tuple[T, list[Any]]:
+            thread_state.hardware = []
+            try:
+                return fn(), thread_state.hardware
+            finally:
+                del thread_state.hardware
+
+        loop = asyncio.get_running_loop()
+        result, hardware = await asyncio.wait_for(
+            loop.run_in_executor(self._executor, job), timeout=timeout
+        )
+        if hardware:
+            self.challenge_sampling._set_hardware(*hardware[-1])
+        return result
+
+    async def sampler(
+        self,
+        circuit: QPQiskitCircuit,
+        n_shots: int,
+        hardware_type: str,
+        timeout: Optional[float] = None,
+    ) -> MeasurementCounts:
+        """Sampling by using a given circuit with a given number of shots and hartware type.
+
+        Args:
+            circuit: A sampling circuit.
+            n_shots: Number of shots for sampling.
+            hardware_type: "sc" for super conducting, "it" for iontrap type hardware.
+            timeout: Timeout of the job in seconds. :class:`asyncio.TimeoutError` is
+                raised when it is reached.
+
+        Returns:
+            Counts of sampling.
+        """
+        counts, qc_time = await self._run(
+            partial(self.challenge_sampling._sample, circuit, n_shots, hardware_type),
+            timeout,
+        )
+        async with self._lock:
+            self.challenge_sampling._add_job(n_shots, qc_time)
+        return counts
+
+    def create_sampler(
+        self, hardware_type: str, timeout: Optional[float] = None
+    ) -> AsyncSampler:
+        """Returns an :class:`AsyncSampler`."""
+
+        async def sampling(circuit: QPQiskitCircuit, n_shots: int) -> MeasurementCounts:
+            return await self.sampler(circuit, n_shots, hardware_type, timeout)
+
+        return sampling
+
+    def create_concurrent_sampler(
+        self, hardware_type: str, timeout: Optional[float] = None
+    ) -> AsyncConcurrentSampler:
+        """Returns an :class:`AsyncConcurrentSampler` which runs the given
+        circuits concurrently."""
+
+        async def sampling(
+            shot_circuit_pairs: Iterable[tuple[QPQiskitCircuit, int]]
+        ) -> Iterable[MeasurementCounts]:
+            return await _gather(
+                self.sampler(circuit, n_shots, hardware_type, timeout)
+                for circuit, n_shots in shot_circuit_pairs
+            )
+
+        return sampling
+
+    async def sampling_estimator(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        timeout: Optional[float] = None,
+    ) -> Estimate[complex]:
+        """Estimate expectation value of a given operator with a given state or qiskit circuit by
+        sampling measurement.
+
+        The arguments are the same as :meth:`ChallengeSampling.sampling_estimator`
+        except for ``timeout``, which is the timeout of the job in seconds.
+        """
+        estimated_value, qc_time = await self._run(
+            partial(
+                self.challenge_sampling._sampling_estimate,
+                operator,
+                state_or_circuit,
+                n_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+            ),
+            timeout,
+        )
+        if qc_time is None:
+            return estimated_value.value.real  # type: ignore
+
+        async with self._lock:
+            self.challenge_sampling._add_job(n_shots, qc_time)
+        return estimated_value
+
+    async def concurrent_sampling_estimator(
+        self,
+        operators: Collection[Estimatable],
+        states: Collection[CircuitQuantumState],
+        total_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        timeout: Optional[float] = None,
+    ) -> Iterable[Estimate[complex]]:
+        """Estimate expectation value of given operators with given states by
+        sampling measurement. The estimations run concurrently.
+
+        The arguments are the same as
+        :meth:`ChallengeSampling.concurrent_sampling_estimator` except for
+        ``timeout``, which is the timeout of each job in seconds.
+        """
+        num_ops = len(operators)
+        num_states = len(states)
+
+        if num_ops == 0:
+            raise ValueError("No operator specified.")
+
+        if num_states == 0:
+            raise ValueError("No state specified.")
+
+        if num_ops > 1 and num_states > 1 and num_ops != num_states:
+            raise ValueError(
+                f"Number of operators ({num_ops}) does not match"
+                f"number of states ({num_states})."
+            )
+
+        if num_states == 1:
+            states = [next(iter(states))] * num_ops
+        if num_ops == 1:
+            operators = [next(iter(operators))] * num_states
+        return await _gather(
+            self.sampling_estimator(
+                op,
+                state,
+                total_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+                timeout,
+            )
+            for op, state in zip(operators, states)
+        )
+
+    def create_sampling_estimator(
+        self,
+        total_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        timeout: Optional[float] = None,
+    ) -> AsyncQuantumEstimator:
+        """Create an :class:`AsyncQuantumEstimator` that estimates operator
+        expectation value by sampling measurement."""
+
+        async def sampling_estimate(
+            operator: Estimatable, state: CircuitQuantumState
+        ) -> Estimate[complex]:
+            return await self.sampling_estimator(
+                operator,
+                state,
+                total_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+                timeout,
+            )
+
+        return sampling_estimate
+
+    def create_concurrent_sampling_estimator(
+        self,
+        total_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        timeout: Optional[float] = None,
+    ) -> AsyncConcurrentQuantumEstimator:
+        """Create an :class:`AsyncConcurrentQuantumEstimator` that estimates
+        operator expectation value by sampling measurement."""
+
+        async def sampling_estimate(
+            operators: Sequence[Estimatable], states: Sequence[CircuitQuantumState]
+        ) -> Iterable[Estimate[complex]]:
+            return await self.concurrent_sampling_estimator(
+                operators,
+                states,
+                total_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+                timeout,
+            )
+
+        return sampling_estimate
+
+    def create_parametric_sampling_estimator(
+        self,
+        total_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        timeout: Optional[float] = None,
+    ) -> AsyncParametricQuantumEstimator:
+        """Create an :class:`AsyncParametricQuantumEstimator` that estimates
+        operator expectation value by sampling measurement."""
+
+        async def parametric_sampling_estimate(
+            operator: Estimatable,
+            state: ParametricCircuitQuantumState,
+            param: Sequence[float],
+        ) -> Estimate[complex]:
+            return await self.sampling_estimator(
+                operator,
+                state.bind_parameters(param),
+                total_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+                timeout,
+            )
+
+        return parametric_sampling_estimate
+
+    def create_concurrent_parametric_sampling_estimator(
+        self,
+        total_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        timeout: Optional[float] = None,
+    ) -> AsyncConcurrentParametricQuantumEstimator:
+        """Create an :class:`AsyncConcurrentParametricQuantumEstimator` that
+        estimates operator expectation value by sampling measurement.
+
+        All the parameter sets are estimated concurrently, which is useful e.g.
+        for parameter shift gradients and line search probes.
+        """
+
+        async def concurrent_parametric_sampling_estimate(
+            operator: Estimatable,
+            state: ParametricCircuitQuantumState,
+            params: Sequence[Sequence[float]],
+        ) -> Iterable[Estimate[complex]]:
+            bind_states = [state.bind_parameters(param) for param in params]
+            return await self.concurrent_sampling_estimator(
+                [operator],
+                bind_states,
+                total_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+                timeout,
+            )
+
+        return concurrent_parametric_sampling_estimate
+
+    def reset(self) -> None:
+        self.challenge_sampling.reset()
+
+
+async def _gather(aws: Iterable[Awaitable[T]]) -> list[T]:
+    """Runs the given awaitables concurrently and returns their results in
+    order. When one of them raises, the others are cancelled."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -1,8 +1,8 @@
+import threading
 from collections.abc import Collection, Iterable
-from typing import Mapping, Sequence, Union
+from typing import TYPE_CHECKING, NamedTuple, Optional, Sequence, Union
 
-from qiskit.circuit import QuantumCircuit as QiskitQuantumCircuit
-from qiskit.opflow import PauliOp, PauliSumOp
+import numpy as np
 from quri_parts.circuit import NonParametricQuantumCircuit
 
 from quri_parts.circuit.noise import (
@@ -12,6 +12,7 @@ from quri_parts.circuit.noise import (
     NoiseModel,
     ThermalRelaxationNoise,
 )
+from quri_parts.circuit.transpile import CircuitTranspiler
 from quri_parts.core.estimator import (
     ConcurrentParametricQuantumEstimator,
     ConcurrentQuantumEstimator,
@@ -34,45 +35,97 @@ from quri_parts.core.state import (
     GeneralCircuitQuantumState,
     ParametricCircuitQuantumState,
 )
-from quri_parts.qiskit.circuit import circuit_from_qiskit
-from quri_parts.qiskit.operator import operator_from_qiskit_op
-from quri_parts.quantinuum.circuit.transpile import QuantinuumSetTranspiler
-from quri_parts.qulacs.sampler import (
-    create_qulacs_noisesimulator_concurrent_sampler,
-    create_qulacs_vector_concurrent_sampler,
-)
 
-from utils.challenge_transpiler import (
-    SCSquareLatticeTranspiler,
-    quri_parts_iontrap_native_circuit,
+if TYPE_CHECKING:
+    from qiskit.circuit import QuantumCircuit as QiskitQuantumCircuit
+    from quri_parts.algo.mitigation.zne.zne import (
+        FoldingMethod,
+        ZeroExtrapolationMethod,
+    )
+
+from utils.classical_shadow import ShadowSuffixes, classical_shadow_estimate_gc
+from utils.conversion_cache import (
+    ConversionCache,
+    ConvertibleCircuit,
+    ConvertibleOperator,
+)
+from utils.measurement_counts import (
+    create_array_noisesimulator_concurrent_sampler,
+    create_array_vector_concurrent_sampler,
+)
+from utils.readout_mitigation import (
+    TensoredReadoutCalibration,
+    readout_calibration_circuits,
+)
+from utils.sampling_estimator import (
+    sampling_estimate_gc,
+    sequential_sampling_estimate_gc,
+    zne_sampling_estimate_gc,
 )
-from utils.sampling_estimator import sampling_estimate_gc
 from time import time
 
 max_qc_time = 1000
 max_run_time = 6 * 10 ** 5
-QPQiskitCircuit = Union[NonParametricQuantumCircuit, QiskitQuantumCircuit]
-QPQiskitOperator = Union[Operator, Union[PauliSumOp, PauliOp]]
+#: QURI Parts, Qiskit or Cirq circuit.
+QPQiskitCircuit = ConvertibleCircuit
+#: QURI Parts, Qiskit or Cirq operator.
+QPQiskitOperator = ConvertibleOperator
+
+
+class _Hardware(NamedTuple):
+    transpiler: CircuitTranspiler
+    noise_model: NoiseModel
+    initializing_time: float
+    gate_time: float
 
 
 class ChallengeSampling:
-    def __init__(self, noise: bool) -> None:
+    """Sampler and estimators that simulate the hardware of the challenge and
+    account for the quantum circuit time.
+
+    Args:
+        noise: Whether the hardware noise is simulated.
+        depth_aware_routing: If ``True``, circuits for "sc" hardware are placed and
+            routed on the lattice with :class:`DepthAwareSquareLatticeRouter` instead
+            of the fixed layout of :class:`SquareLatticeSWAPInsertionTranspiler`.
+        peephole_optimization: If ``True``, circuits for "it" hardware are optimized
+            with :class:`QuantinuumPeepholeTranspiler` after being transpiled to
+            the native gates.
+    """
+
+    def __init__(
+        self,
+        noise: bool,
+        depth_aware_routing: bool = False,
+        peephole_optimization: bool = False,
+    ) -> None:
         self.total_shots: int = 0
         self.total_jobs: int = 0
         self.total_quantum_circuit_time: float = 0.0
         self._noise = noise
+        self._depth_aware_routing = depth_aware_routing
+        self._peephole_optimization = peephole_optimization
         self.transpiler = None
         self.transpiled_circuit = None
         self.gate_time: float = 0
         self.initializing_time: float = 0
         self.init_time: float = time()
+        #: calibrations and their shots by hardware type and number of qubits
+        self._readout_calibrations: dict[
+            tuple[str, int], tuple[int, TensoredReadoutCalibration]
+        ] = {}
+        self._conversion_cache = ConversionCache()
+        self._shadow_suffixes: dict[str, ShadowSuffixes] = {}
+        #: per-thread list collecting the hardware used by a job instead of
+        #: setting the public attributes, see :meth:`_set_hardware`
+        self._thread_state = threading.local()
 
     def sampler(
         self,
         circuit: QPQiskitCircuit,
         n_shots: int,
         hardware_type: str,
-    ) -> Iterable[Mapping[int, Union[int, float]]]:
+    ) -> MeasurementCounts:
         """Sampling by using a given circuit with a given number of shots and hartware type.
 
         Args:
@@ -83,29 +136,8 @@ class ChallengeSampling:
         Returns:
             Counts of sampling.
         """
-        if isinstance(circuit, QiskitQuantumCircuit):
-            circuit = circuit_from_qiskit(circuit)
-
-        noise_model, transpiled_circuit = self._noise_model_with_transpiled_circuit(
-            circuit, hardware_type
-        )
-        concurrent_sampler = self._concurrent_sampler(noise_model)
-        if hardware_type == "it":
-            transpiled_circuit = quri_parts_iontrap_native_circuit(transpiled_circuit)
-        counts = concurrent_sampler([(transpiled_circuit, n_shots)])[0]
-
-        self.total_jobs += 1
-        self.total_shots += n_shots
-        tot_gate_time = transpiled_circuit.depth * self.gate_time * n_shots
-        tot_initializing_time = self.initializing_time * n_shots
-        tot_time = tot_gate_time + tot_initializing_time
-        self.total_quantum_circuit_time += tot_time
-
-        now_time = time()
-        run_time = now_time - self.init_time
-        if self.total_quantum_circuit_time > max_qc_time or run_time > max_run_time:
-            raise TimeExceededError(self.total_quantum_circuit_time, run_time)
-
+        counts, qc_time = self._sample(circuit, n_shots, hardware_type)
+        self._add_job(n_shots, qc_time)
         return counts
 
     def create_sampler(self, hardware_type: str) -> Sampler:
@@ -130,10 +162,66 @@ class ChallengeSampling:
 
         return sampling
 
+    def readout_calibration(
+        self, hardware_type: str, qubit_count: int, shots: int
+    ) -> TensoredReadoutCalibration:
+        """Returns the tensored readout calibration of a given hardware type and
+        number of qubits.
+
+        The calibration runs the 2n circuits of
+        :func:`readout_calibration_circuits` with ``shots`` shots each, which are
+        charged as usual. It is cached for the hardware type and number of qubits
+        until :meth:`reset` is called, and the cached calibration is returned as
+        long as it was run with at least ``shots`` shots. A request with more
+        shots runs the calibration again and replaces the cached one.
+        """
+        key = (hardware_type, qubit_count)
+        cached = self._readout_calibrations.get(key)
+        if cached is not None and cached[0] >= shots:
+            return cached[1]
+        counts = [
+            self.sampler(circuit, shots, hardware_type)
+            for circuit in readout_calibration_circuits(qubit_count)
+        ]
+        calibration = TensoredReadoutCalibration.from_counts(counts)
+        self._readout_calibrations[key] = (shots, calibration)
+        return calibration
+
+    def create_readout_mitigation_sampler(
+        self, hardware_type: str, calibration_shots: int
+    ) -> Sampler:
+        """Returns a :class:`~Sampler` whose counts are corrected for readout
+        errors with the cached calibration of :meth:`readout_calibration`."""
+
+        def sampling(circuit: QPQiskitCircuit, n_shots: int) -> MeasurementCounts:
+            return self._readout_mitigated_sample(
+                circuit, n_shots, hardware_type, calibration_shots
+            )
+
+        return sampling
+
+    def create_readout_mitigation_concurrent_sampler(
+        self, hardware_type: str, calibration_shots: int
+    ) -> ConcurrentSampler:
+        """Returns a :class:`~ConcurrentSampler` whose counts are corrected for
+        readout errors with the cached calibration of :meth:`readout_calibration`."""
+
+        def sampling(
+            shot_circuit_pairs: Iterable[tuple[QPQiskitCircuit, int]]
+        ) -> Iterable[MeasurementCounts]:
+            return [
+                self._readout_mitigated_sample(
+                    circuit, n_shots, hardware_type, calibration_shots
+                )
+                for circuit, n_shots in shot_circuit_pairs
+            ]
+
+        return sampling
+
     def sampling_estimator(
         self,
         operator: QPQiskitOperator,
-        state_or_circuit: Union[CircuitQuantumState, QiskitQuantumCircuit],
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
         n_shots: int,
         measurement_factory: CommutablePauliSetMeasurementFactory,
         shots_allocator: PauliSamplingShotsAllocator,
@@ -159,55 +247,175 @@ class ChallengeSampling:
                 of estimation (can be accessed with :attr:`.error`).
         """
 
-        if isinstance(operator, PauliSumOp) or isinstance(operator, PauliOp):
-            operator = operator_from_qiskit_op(operator)
+        estimated_value, qc_time = self._sampling_estimate(
+            operator,
+            state_or_circuit,
+            n_shots,
+            measurement_factory,
+            shots_allocator,
+            hardware_type,
+        )
+        if qc_time is None:
+            return estimated_value.value.real
+
+        self._add_job(n_shots, qc_time)
+        return estimated_value
 
-        if isinstance(state_or_circuit, QiskitQuantumCircuit):
-            circuit = circuit_from_qiskit(state_or_circuit)
-        else:
-            circuit = state_or_circuit.circuit
+    def sequential_sampling_estimator(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        max_shots: int,
+        chunk_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        target_error: Optional[float] = None,
+        time_budget: Optional[float] = None,
+    ) -> tuple[Estimate[complex], int]:
+        """Estimate expectation value of a given operator with a given state or qiskit circuit by
+        sampling measurement in chunks, stopping early once the estimate is precise enough.
 
-        noise_model, transpiled_circuit = self._noise_model_with_transpiled_circuit(
-            circuit=circuit, hardware_type=hardware_type
-        )
+        Only the shots actually consumed are charged to
+        :attr:`total_quantum_circuit_time`.
+
+        Args:
+            operator: An operator of which expectation value is estimated.
+            state_or_circuit: A quantum state on which the operator expectation is evaluated.
+            max_shots: Maximum number of shots available for sampling measurements.
+            chunk_shots: Number of shots sampled before the stopping criteria are checked.
+            measurement_factory: A function that performs Pauli grouping and returns
+                a measurement scheme for Pauli operators constituting the original operator.
+            shots_allocator: A function that allocates the shots budgeted so far,
+                a multiple of ``chunk_shots``, to Pauli groups to be measured. Each
+                chunk samples the allocated shots not sampled yet.
+            hardware_type: "sc" for super conducting, "it" for iontrap type hardware.
+            target_error: Standard error at which sampling stops. It is not reached
+                before every group has been sampled at least twice.
+            time_budget: Quantum circuit time in seconds this estimation may spend.
 
-        state = GeneralCircuitQuantumState(
-            transpiled_circuit.qubit_count, transpiled_circuit
+        Returns:
+            The estimated value (can be accessed with :attr:`.value`) with standard error
+                of estimation (can be accessed with :attr:`.error`) and the number of shots
+                actually consumed.
+        """
+        estimated_value, n_shots, qc_time = self._sequential_sampling_estimate(
+            operator,
+            state_or_circuit,
+            max_shots,
+            chunk_shots,
+            measurement_factory,
+            shots_allocator,
+            hardware_type,
+            target_error,
+            time_budget,
         )
+        if qc_time is not None:
+            self._add_job(n_shots, qc_time)
+        return estimated_value, n_shots
 
-        concurrent_sampler = self._concurrent_sampler(noise_model)
+    def zne_sampling_estimator(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        scale_factors: Sequence[float],
+        extrapolate_method: "ZeroExtrapolationMethod",
+        folding_method: "FoldingMethod",
+    ) -> Estimate[complex]:
+        """Estimate expectation value of a given operator with a given state or qiskit circuit by
+        sampling measurement with zero noise extrapolation.
 
-        estimated_value, circuit_and_shots = sampling_estimate_gc(
-            op=operator,
-            state=state,
-            total_shots=n_shots,
-            sampler=concurrent_sampler,
-            hardware_type=hardware_type,
-            measurement_factory=measurement_factory,
-            shots_allocator=shots_allocator,
+        The circuit is transpiled once and the native circuit is folded for each
+        scale factor, so that the grouping, the shot allocation and the
+        transpilation are shared between the scale factors. The charged time is
+        computed from the depth of the folded circuits actually sampled.
+
+        Args:
+            operator: An operator of which expectation value is estimated.
+            state_or_circuit: A quantum state on which the operator expectation is evaluated.
+            n_shots: Total number of shots available for sampling measurements for each
+                scale factor.
+            measurement_factory: A function that performs Pauli grouping and returns
+                a measurement scheme for Pauli operators constituting the original operator.
+            shots_allocator: A function that allocates the total shots to Pauli groups to
+                be measured.
+            hardware_type: "sc" for super conducting, "it" for iontrap type hardware.
+            scale_factors: Factors to scale the circuit. Real numbers that satisfy >= 1.
+            extrapolate_method: :class:`ZeroExtrapolationMethod` that determines the
+                method of extrapolation.
+            folding_method: :class:`FoldingMethod` that determines the method of folding.
+
+        Returns:
+            The extrapolated value (can be accessed with :attr:`.value`).
+        """
+        estimated_value, total_shots, qc_time = self._zne_sampling_estimate(
+            operator,
+            state_or_circuit,
+            n_shots,
+            measurement_factory,
+            shots_allocator,
+            hardware_type,
+            scale_factors,
+            extrapolate_method,
+            folding_method,
         )
-        if len(operator) == 0:
-            return estimated_value.value.real
+        if qc_time is None:
+            return estimated_value
 
-        if PAULI_IDENTITY in operator:
-            if len(operator) == 1:
-                return estimated_value.value.real
+        self._add_job(total_shots, qc_time)
+        return estimated_value
 
-        self.total_jobs += 1
-        self.total_shots += n_shots
-        tot_gate_time, tot_initializing_time = 0.0, 0.0
-        for circuit_shots in circuit_and_shots:
-            circuit_depth = self.transpiler(circuit_shots[0]).depth
-            tot_gate_time += float(self.gate_time * circuit_depth * circuit_shots[1])
-            tot_initializing_time += self.initializing_time * circuit_shots[1]
-        tot_time = tot_gate_time + tot_initializing_time
-        self.total_quantum_circuit_time += tot_time
+    def classical_shadow_estimator(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        n_bases: int,
+        hardware_type: str,
+        n_groups: int = 8,
+        seed: Union[None, int, np.random.Generator] = None,
+    ) -> Estimate[complex]:
+        """Estimate expectation value of a given operator with a given state or qiskit circuit by
+        randomized measurement (classical shadow).
 
-        now_time = time()
-        run_time = now_time - self.init_time
-        if self.total_quantum_circuit_time > max_qc_time or run_time > max_run_time:
-            raise TimeExceededError(self.total_quantum_circuit_time, run_time)
+        The total shots are distributed to ``n_bases`` random local Pauli bases,
+        and to additional bases measuring the terms which none of the random
+        bases matches, see :func:`~utils.classical_shadow.classical_shadow_estimate_gc`.
+        The circuits are composed of the transpiled state circuit and cached
+        transpiled basis rotations, and sampled in a batch. All the terms of the
+        operator are reconstructed from the same snapshots with the median of
+        means. Each circuit is charged as usual.
+
+        Args:
+            operator: An operator of which expectation value is estimated.
+            state_or_circuit: A quantum state on which the operator expectation is evaluated.
+            n_shots: Total number of shots available for sampling measurements.
+            n_bases: Number of random measurement bases.
+            hardware_type: "sc" for super conducting, "it" for iontrap type hardware.
+            n_groups: Number of groups of the median of means.
+            seed: A seed or a :class:`numpy.random.Generator` drawing the bases.
+
+        Returns:
+            The estimated value (can be accessed with :attr:`.value`) with standard error
+                of estimation (can be accessed with :attr:`.error`).
+        """
+        estimated_value, qc_time = self._classical_shadow_estimate(
+            operator,
+            state_or_circuit,
+            n_shots,
+            n_bases,
+            hardware_type,
+            n_groups,
+            seed,
+        )
+        if qc_time is None:
+            return estimated_value
 
+        self._add_job(n_shots, qc_time)
         return estimated_value
 
     def concurrent_sampling_estimator(
@@ -409,6 +617,155 @@ class ChallengeSampling:
 
         return concurrent_parametric_sampling_estimater
 
+    def create_zne_sampling_estimator(
+        self,
+        total_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        scale_factors: Sequence[float],
+        extrapolate_method: "ZeroExtrapolationMethod",
+        folding_method: "FoldingMethod",
+    ) -> QuantumEstimator[CircuitQuantumState]:
+        """Create a :class:`QuantumEstimator` that estimates operator expectation
+        value by sampling measurement with zero noise extrapolation.
+
+        The arguments are the same as :meth:`zne_sampling_estimator`.
+        """
+
+        def sampling_estimate(
+            operators: Estimatable, states: CircuitQuantumState
+        ) -> Estimate[complex]:
+            return self.zne_sampling_estimator(
+                operators,
+                states,
+                total_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+                scale_factors,
+                extrapolate_method,
+                folding_method,
+            )
+
+        return sampling_estimate
+
+    def create_classical_shadow_estimator(
+        self,
+        total_shots: int,
+        n_bases: int,
+        hardware_type: str,
+        n_groups: int = 8,
+        seed: Optional[int] = None,
+    ) -> QuantumEstimator[CircuitQuantumState]:
+        """Create a :class:`QuantumEstimator` that estimates operator expectation
+        value by randomized measurement (classical shadow). Each estimation draws
+        new bases.
+
+        The arguments are the same as :meth:`classical_shadow_estimator`.
+        """
+        rng = np.random.default_rng(seed)
+
+        def sampling_estimate(
+            operators: Estimatable, states: CircuitQuantumState
+        ) -> Estimate[complex]:
+            return self.classical_shadow_estimator(
+                operators,
+                states,
+                total_shots,
+                n_bases,
+                hardware_type,
+                n_groups,
+                rng,
+            )
+
+        return sampling_estimate
+
+    def create_sequential_sampling_estimator(
+        self,
+        max_shots: int,
+        chunk_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        target_error: Optional[float] = None,
+        time_budget: Optional[float] = None,
+    ) -> QuantumEstimator[CircuitQuantumState]:
+        """Create a :class:`QuantumEstimator` that estimates operator expectation
+        value by sampling measurement with early stopping.
+
+        The arguments are the same as :meth:`sequential_sampling_estimator`.
+        """
+
+        def sampling_estimate(
+            operators: Estimatable, states: CircuitQuantumState
+        ) -> Estimate[complex]:
+            estimated_value, _ = self.sequential_sampling_estimator(
+                operators,
+                states,
+                max_shots,
+                chunk_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+                target_error,
+                time_budget,
+            )
+            return estimated_value
+
+        return sampling_estimate
+
+    def create_concurrent_parametric_sequential_sampling_estimator(
+        self,
+        max_shots: int,
+        chunk_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        target_error: Optional[float] = None,
+        time_budget: Optional[float] = None,
+    ) -> ConcurrentParametricQuantumEstimator[ParametricCircuitQuantumState]:
+        """Create a :class:`ConcurrentParametricQuantumEstimator` that estimates
+        operator expectation value by sampling measurement with early stopping.
+
+        The arguments are the same as :meth:`sequential_sampling_estimator`.
+        """
+        sampling_estimator = self.create_sequential_sampling_estimator(
+            max_shots,
+            chunk_shots,
+            measurement_factory,
+            shots_allocator,
+            hardware_type,
+            target_error,
+            time_budget,
+        )
+
+        def concurrent_parametric_sampling_estimater(
+            operator: Estimatable,
+            state: ParametricCircuitQuantumState,
+            params: Sequence[Sequence[float]],
+        ) -> Iterable[Estimate[complex]]:
+            return [
+                sampling_estimator(operator, state.bind_parameters(param))
+                for param in params
+            ]
+
+        return concurrent_parametric_sampling_estimater
+
+    def parametric_state_from_qiskit(
+        self, circuit: "QiskitQuantumCircuit"
+    ) -> ParametricCircuitQuantumState:
+        """Returns a parametric state of a parameterized Qiskit circuit, which can
+        be used with the parametric estimators.
+
+        The circuit is converted once and cached, and the parameters are ordered as
+        ``circuit.parameters``.
+        """
+        parametric_circuit = self._conversion_cache.parametric_circuit(circuit)
+        return ParametricCircuitQuantumState(
+            parametric_circuit.qubit_count, parametric_circuit
+        )
+
     def _noise_model(
         self,
         bitflip_error: float,
@@ -443,20 +800,284 @@ class ChallengeSampling:
 
     def _concurrent_sampler(self, noise_model: NoiseModel) -> ConcurrentSampler:
         if self._noise:
-            concurrent_sampler = create_qulacs_noisesimulator_concurrent_sampler(
+            concurrent_sampler = create_array_noisesimulator_concurrent_sampler(
                 model=noise_model,
             )
         else:
-            concurrent_sampler = create_qulacs_vector_concurrent_sampler()
+            concurrent_sampler = create_array_vector_concurrent_sampler()
         return concurrent_sampler
 
-    def _noise_model_with_transpiled_circuit(
+    def _state_circuit(
+        self, state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit]
+    ) -> NonParametricQuantumCircuit:
+        if isinstance(state_or_circuit, CircuitQuantumState):
+            return state_or_circuit.circuit
+        return self._conversion_cache.circuit(state_or_circuit)
+
+    def _sample(
+        self,
+        circuit: QPQiskitCircuit,
+        n_shots: int,
+        hardware_type: str,
+    ) -> tuple[MeasurementCounts, float]:
+        """Samples a given circuit without accounting and returns the counts
+        with the quantum circuit time to be charged."""
+        circuit = self._conversion_cache.circuit(circuit)
+
+        hardware, transpiled_circuit = self._hardware_with_transpiled_circuit(
+            circuit, hardware_type
+        )
+        concurrent_sampler = self._concurrent_sampler(hardware.noise_model)
+        if hardware_type == "it":
+            from utils.challenge_transpiler import quri_parts_iontrap_native_circuit
+
+            transpiled_circuit = quri_parts_iontrap_native_circuit(transpiled_circuit)
+        (counts,) = concurrent_sampler([(transpiled_circuit, n_shots)])
+
+        tot_gate_time = transpiled_circuit.depth * hardware.gate_time * n_shots
+        tot_initializing_time = hardware.initializing_time * n_shots
+        return counts, tot_gate_time + tot_initializing_time
+
+    def _readout_mitigated_sample(
+        self,
+        circuit: QPQiskitCircuit,
+        n_shots: int,
+        hardware_type: str,
+        calibration_shots: int,
+    ) -> MeasurementCounts:
+        """Samples a given circuit and corrects the counts for readout errors with
+        the cached calibration of :meth:`readout_calibration`."""
+        circuit = self._conversion_cache.circuit(circuit)
+        calibration = self.readout_calibration(
+            hardware_type, circuit.qubit_count, calibration_shots
+        )
+        counts = self.sampler(circuit, n_shots, hardware_type)
+        return calibration.mitigate(counts)
+
+    def _sampling_estimate(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+    ) -> tuple[Estimate[complex], Optional[float]]:
+        """Estimates an expectation value without accounting and returns the
+        estimate with the quantum circuit time to be charged, which is ``None``
+        when no circuit needs to be executed."""
+        operator = self._conversion_cache.operator(operator)
+        circuit = self._state_circuit(state_or_circuit)
+
+        hardware, _ = self._hardware_with_transpiled_circuit(
+            circuit=circuit, hardware_type=hardware_type
+        )
+        # the measurement circuits are transpiled as a whole, since a routing
+        # transpiler is not idempotent
+        state = GeneralCircuitQuantumState(circuit.qubit_count, circuit)
+
+        concurrent_sampler = self._concurrent_sampler(hardware.noise_model)
+
+        estimated_value, circuit_and_shots = sampling_estimate_gc(
+            op=operator,
+            state=state,
+            total_shots=n_shots,
+            sampler=concurrent_sampler,
+            hardware_type=hardware_type,
+            measurement_factory=measurement_factory,
+            shots_allocator=shots_allocator,
+            transpiler=hardware.transpiler,
+        )
+        if len(operator) == 0:
+            return estimated_value, None
+
+        if PAULI_IDENTITY in operator:
+            if len(operator) == 1:
+                return estimated_value, None
+
+        tot_gate_time, tot_initializing_time = 0.0, 0.0
+        for circuit_shots in circuit_and_shots:
+            circuit_depth = circuit_shots[0].depth
+            tot_gate_time += float(hardware.gate_time * circuit_depth * circuit_shots[1])
+            tot_initializing_time += hardware.initializing_time * circuit_shots[1]
+        return estimated_value, tot_gate_time + tot_initializing_time
+
+    def _sequential_sampling_estimate(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        max_shots: int,
+        chunk_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        target_error: Optional[float],
+        time_budget: Optional[float],
+    ) -> tuple[Estimate[complex], int, Optional[float]]:
+        operator = self._conversion_cache.operator(operator)
+        circuit = self._state_circuit(state_or_circuit)
+
+        hardware, _ = self._hardware_with_transpiled_circuit(
+            circuit=circuit, hardware_type=hardware_type
+        )
+        state = GeneralCircuitQuantumState(circuit.qubit_count, circuit)
+
+        def shot_time(circuit: NonParametricQuantumCircuit) -> float:
+            return hardware.initializing_time + hardware.gate_time * circuit.depth
+
+        estimated_value, circuit_and_shots = sequential_sampling_estimate_gc(
+            op=operator,
+            state=state,
+            max_shots=max_shots,
+            chunk_shots=chunk_shots,
+            sampler=self._concurrent_sampler(hardware.noise_model),
+            hardware_type=hardware_type,
+            measurement_factory=measurement_factory,
+            shots_allocator=shots_allocator,
+            target_error=target_error,
+            time_budget=time_budget,
+            shot_time=shot_time,
+            transpiler=hardware.transpiler,
+        )
+        n_shots = sum(shots for _, shots in circuit_and_shots)
+        if n_shots == 0:
+            return estimated_value, 0, None
+
+        qc_time = sum(shot_time(circuit) * shots for circuit, shots in circuit_and_shots)
+        return estimated_value, n_shots, qc_time
+
+    def _zne_sampling_estimate(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        scale_factors: Sequence[float],
+        extrapolate_method: "ZeroExtrapolationMethod",
+        folding_method: "FoldingMethod",
+    ) -> tuple[Estimate[complex], int, Optional[float]]:
+        operator = self._conversion_cache.operator(operator)
+        circuit = self._state_circuit(state_or_circuit)
+
+        hardware, _ = self._hardware_with_transpiled_circuit(
+            circuit=circuit, hardware_type=hardware_type
+        )
+        state = GeneralCircuitQuantumState(circuit.qubit_count, circuit)
+
+        estimated_value, circuit_and_shots = zne_sampling_estimate_gc(
+            op=operator,
+            state=state,
+            total_shots=n_shots,
+            sampler=self._concurrent_sampler(hardware.noise_model),
+            hardware_type=hardware_type,
+            measurement_factory=measurement_factory,
+            shots_allocator=shots_allocator,
+            scale_factors=scale_factors,
+            extrapolate_method=extrapolate_method,
+            folding_method=folding_method,
+            transpiler=hardware.transpiler,
+        )
+        if len(operator) == 0:
+            return estimated_value, 0, None
+
+        if PAULI_IDENTITY in operator:
+            if len(operator) == 1:
+                return estimated_value, 0, None
+
+        total_shots, qc_time = 0, 0.0
+        for folded_circuit, shots in circuit_and_shots:
+            total_shots += shots
+            qc_time += (
+                hardware.initializing_time + hardware.gate_time * folded_circuit.depth
+            ) * shots
+        return estimated_value, total_shots, qc_time
+
+    def _classical_shadow_estimate(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        n_bases: int,
+        hardware_type: str,
+        n_groups: int,
+        seed: Union[None, int, np.random.Generator],
+    ) -> tuple[Estimate[complex], Optional[float]]:
+        operator = self._conversion_cache.operator(operator)
+        circuit = self._state_circuit(state_or_circuit)
+
+        hardware, _ = self._hardware_with_transpiled_circuit(
+            circuit=circuit, hardware_type=hardware_type
+        )
+        state = GeneralCircuitQuantumState(circuit.qubit_count, circuit)
+
+        # the basis rotations can not be appended to a circuit whose qubits are
+        # relabeled by routing
+        suffixes = None
+        if not (hardware_type == "sc" and self._depth_aware_routing):
+            if hardware_type not in self._shadow_suffixes:
+                self._shadow_suffixes[hardware_type] = ShadowSuffixes(
+                    hardware.transpiler
+                )
+            suffixes = self._shadow_suffixes[hardware_type]
+
+        estimated_value, circuit_and_shots = classical_shadow_estimate_gc(
+            op=operator,
+            state=state,
+            total_shots=n_shots,
+            n_bases=n_bases,
+            sampler=self._concurrent_sampler(hardware.noise_model),
+            hardware_type=hardware_type,
+            n_groups=n_groups,
+            transpiler=hardware.transpiler,
+            suffixes=suffixes,
+            rng=np.random.default_rng(seed),
+        )
+        if len(operator) == 0:
+            return estimated_value, None
+
+        if PAULI_IDENTITY in operator:
+            if len(operator) == 1:
+                return estimated_value, None
+
+        qc_time = 0.0
+        for shadow_circuit, shots in circuit_and_shots:
+            qc_time += (
+                hardware.initializing_time + hardware.gate_time * shadow_circuit.depth
+            ) * shots
+        return estimated_value, qc_time
+
+    def _add_job(self, n_shots: int, qc_time: float) -> None:
+        """Charges a finished job and raises :class:`TimeExceededError` if the
+        time budget is exhausted."""
+        self.total_jobs += 1
+        self.total_shots += n_shots
+        self.total_quantum_circuit_time += qc_time
+        self._check_time()
+
+    def _check_time(self) -> None:
+        now_time = time()
+        run_time = now_time - self.init_time
+        if self.total_quantum_circuit_time > max_qc_time or run_time > max_run_time:
+            raise TimeExceededError(self.total_quantum_circuit_time, run_time)
+
+    def _hardware_with_transpiled_circuit(
         self,
         circuit: NonParametricQuantumCircuit,
         hardware_type: str,
-    ) -> tuple[NoiseModel, NonParametricQuantumCircuit]:
+    ) -> tuple[_Hardware, NonParametricQuantumCircuit]:
+        # the transpilers of each hardware type are imported on first use
         if hardware_type == "sc":
-            transpiler = SCSquareLatticeTranspiler()
+            from utils.challenge_transpiler import (
+                SCDepthAwareSquareLatticeTranspiler,
+                SCSquareLatticeTranspiler,
+            )
+
+            if self._depth_aware_routing:
+                transpiler = SCDepthAwareSquareLatticeTranspiler()
+            else:
+                transpiler = SCSquareLatticeTranspiler()
             # decompose to X, SX, RZ, CNOT, Identity
             # sc (super conductor type) transpiler
             transpiled_circuit = transpiler(circuit)
@@ -469,7 +1090,14 @@ class ChallengeSampling:
             initializing_time = 1e-6
             gate_time = 1e-6
         elif hardware_type == "it":
-            transpiler = QuantinuumSetTranspiler()
+            from quri_parts.quantinuum.circuit.transpile import QuantinuumSetTranspiler
+
+            from utils.challenge_transpiler import QuantinuumPeepholeSetTranspiler
+
+            if self._peephole_optimization:
+                transpiler = QuantinuumPeepholeSetTranspiler()
+            else:
+                transpiler = QuantinuumSetTranspiler()
             #: decompose to Quantinuum native gates U1q, ZZ, RZZ, RZ
             transpiled_circuit = transpiler(circuit)
 
@@ -492,20 +1120,39 @@ class ChallengeSampling:
             t2=t2,
             gate_time=gate_time,
         )
-        self.initializing_time = initializing_time
-        self.gate_time = gate_time
-        self.transpiler = transpiler
+        hardware = _Hardware(transpiler, noise_model, initializing_time, gate_time)
+        deferred = getattr(self._thread_state, "hardware", None)
+        if deferred is None:
+            self._set_hardware(hardware, transpiled_circuit)
+        else:
+            deferred.append((hardware, transpiled_circuit))
+        return hardware, transpiled_circuit
+
+    def _set_hardware(
+        self, hardware: _Hardware, transpiled_circuit: NonParametricQuantumCircuit
+    ) -> None:
+        """Sets the public attributes describing the hardware of the last job.
+
+        Jobs running on other threads, e.g. those of
+        :class:`~utils.async_sampling.AsyncChallengeSampling`, set a list as
+        ``self._thread_state.hardware`` to collect the hardware instead, so that
+        their caller sets the attributes on its own thread.
+        """
+        self.initializing_time = hardware.initializing_time
+        self.gate_time = hardware.gate_time
+        self.transpiler = hardware.transpiler
         self.transpiled_circuit = transpiled_circuit
-        return noise_model, transpiled_circuit
 
     def reset(self) -> None:
         self.total_shots = 0
         self.total_jobs = 0
         self.total_quantum_circuit_time = 0
+        self._readout_calibrations = {}
 
 
 class TimeExceededError(Exception):
     def __init__(self, qc_time: float, run_time: float):
+        super().__init__(qc_time, run_time)
         self.qc_time = qc_time
         self.run_time = run_time
 
@@ -1,14 +1,25 @@
-from typing import Callable, cast
+from typing import TYPE_CHECKING, Callable, Optional, Sequence, cast
 
 import numpy as np
+import numpy.typing as npt
 from qulacs.gate import DenseMatrix
-from quri_parts.circuit import QuantumCircuit, QuantumGate, UnitaryMatrix
+from quri_parts.circuit import (
+    RZ,
+    SqrtX,
+    X,
+    NonParametricQuantumCircuit,
+    QuantumCircuit,
+    QuantumGate,
+    UnitaryMatrix,
+    gate_names,
+)
 from quri_parts.circuit.topology import (
     SquareLattice,
     SquareLatticeSWAPInsertionTranspiler,
 )
 from quri_parts.circuit.transpile import (
     CircuitTranspiler,
+    CircuitTranspilerProtocol,
     CZ2CNOTHTranspiler,
     H2RZSqrtXTranspiler,
     ParallelDecomposer,
@@ -16,8 +27,15 @@ from quri_parts.circuit.transpile import (
     SequentialTranspiler,
     SWAP2CNOTTranspiler,
 )
+from quri_parts.quantinuum.circuit import RZZ, ZZ, U1q
+from quri_parts.quantinuum.circuit.transpile import QuantinuumSetTranspiler
 from quri_parts.qulacs.circuit import convert_gate
 
+from utils.sc_routing import DepthAwareSquareLatticeRouter
+
+if TYPE_CHECKING:
+    from quri_parts.algo.mitigation.zne.zne import FoldingMethod
+
 SCSquareLatticeTranspiler: Callable[
     [], CircuitTranspiler
 ] = lambda: SequentialTranspiler(
@@ -30,6 +48,18 @@ SCSquareLatticeTranspiler: Callable[
     ]
 )
 
+SCDepthAwareSquareLatticeTranspiler: Callable[
+    [], CircuitTranspiler
+] = lambda: SequentialTranspiler(
+    [
+        RZSetTranspiler(),
+        DepthAwareSquareLatticeRouter(xsize=8, ysize=8),
+        ParallelDecomposer(
+            [CZ2CNOTHTranspiler(), SWAP2CNOTTranspiler(), H2RZSqrtXTranspiler()]
+        ),
+    ]
+)
+
 
 def complex_exp(angle: float) -> complex:
     return cast(complex, np.cos(angle) + 1j * np.sin(angle))
@@ -70,7 +100,9 @@ def quri_parts_iontrap_native_gate(gate: QuantumGate) -> QuantumGate:
     return unitary_matrix
 
 
-def quri_parts_iontrap_native_circuit(circuit: QuantumCircuit) -> QuantumCircuit:
+def quri_parts_iontrap_native_circuit(
+    circuit: NonParametricQuantumCircuit,
+) -> QuantumCircuit:
     qc = QuantumCircuit(circuit.qubit_count)
     for gate in circuit.gates:
         qc.add_gate(gate=quri_parts_iontrap_native_gate(gate))
@@ -91,5 +123,240 @@ def convert_iontrap_native_gate(gate: QuantumGate) -> DenseMatrix:
         raise ValueError(f"Invalid native gate name: {gate.name}")
 
 
+class QuantinuumPeepholeTranspiler(CircuitTranspilerProtocol):
+    """CircuitTranspiler, which reduces the depth of a circuit of the it native
+    gates (U1q, RZ, ZZ, RZZ) as returned by :class:`QuantinuumSetTranspiler`.
+
+    * Sequences of U1q and RZ gates on a qubit are merged.
+    * RZ gates, which commute with ZZ and RZZ gates, are moved toward the end of
+      the circuit.
+    * ZZ and RZZ gates on the same pair of qubits are merged as long as no U1q gate
+      acts on the pair in between, so that inverse pairs cancel. RZZ(pi) is
+      replaced by RZ(pi) on both qubits.
+
+    A merged single qubit rotation is emitted as at most two U1q gates whose theta
+    is pi/2 or pi, followed by the RZ gates at the end of the circuit. No gate is
+    moved across other gates, e.g. Identity, which are left as they are. The
+    returned circuit is equal to the input up to a global phase.
+    """
+
+    def __init__(self, epsilon: float = 1.0e-9):
+        self._epsilon = epsilon
+
+    def __call__(
+        self, circuit: NonParametricQuantumCircuit
+    ) -> NonParametricQuantumCircuit:
+        gates: list[QuantumGate] = []
+        #: invariant: a qubit with a pending ZZ-type angle has a diagonal pending
+        #: single qubit unitary
+        pending: dict[int, npt.NDArray[np.complex128]] = {}
+        pending_zz: dict[tuple[int, int], float] = {}
+
+        def flush_zz(qubits: set[int]) -> None:
+            # the pairs acting on the qubits are emitted with the earlier pairs
+            # sharing a qubit with them, in order, so that the depth is kept
+            flushed: list[tuple[int, int]] = []
+            touched = set(qubits)
+            for pair in reversed(pending_zz):
+                if pair[0] in touched or pair[1] in touched:
+                    flushed.append(pair)
+                    touched.update(pair)
+            for pair in reversed(flushed):
+                angle = _normalize_angle(pending_zz.pop(pair))
+                if abs(angle) < self._epsilon:
+                    continue
+                if abs(abs(angle) - np.pi) < self._epsilon:
+                    #: RZZ(pi) = Z x Z = RZ(pi) x RZ(pi) up to a global phase
+                    for q in pair:
+                        pending[q] = _rz_matrix(np.pi) @ pending.get(q, _IDENTITY)
+                elif abs(angle - np.pi / 2) < self._epsilon:
+                    gates.append(ZZ(*pair))
+                else:
+                    gates.append(RZZ(*pair, angle))
+
+        def flush_u1q(qubit: int) -> None:
+            if qubit not in pending:
+                return
+            alpha, theta, phi = _rz_u1q_angles(pending[qubit], self._epsilon)
+            if theta < self._epsilon:
+                pass
+            elif (
+                abs(theta - np.pi / 2) < self._epsilon
+                or abs(theta - np.pi) < self._epsilon
+            ):
+                gates.append(U1q(qubit, theta, phi))
+            else:
+                #: U1q(theta, phi)
+                #: = RZ(theta) U1q(pi/2, phi + pi/2 - theta) U1q(pi/2, phi - pi/2)
+                gates.append(U1q(qubit, np.pi / 2, phi - np.pi / 2))
+                gates.append(U1q(qubit, np.pi / 2, phi + np.pi / 2 - theta))
+                alpha += theta
+            pending[qubit] = _rz_matrix(alpha)
+
+        def flush(qubit: int) -> Optional[QuantumGate]:
+            flush_u1q(qubit)
+            if qubit not in pending:
+                return None
+            alpha, _, _ = _rz_u1q_angles(pending.pop(qubit), self._epsilon)
+            alpha = _normalize_angle(alpha)
+            return RZ(qubit, alpha) if abs(alpha) >= self._epsilon else None
+
+        for gate in circuit.gates:
+            if gate.name == "U1q":
+                qubit = gate.target_indices[0]
+                flush_zz({qubit})
+                matrix = np.array(iontrap_native_gate_representation(gate))
+                pending[qubit] = matrix @ pending.get(qubit, _IDENTITY)
+            elif gate.name == gate_names.RZ:
+                qubit = gate.target_indices[0]
+                matrix = _rz_matrix(gate.params[0])
+                pending[qubit] = matrix @ pending.get(qubit, _IDENTITY)
+            elif gate.name == "ZZ" or gate.name == "RZZ":
+                for qubit in gate.target_indices:
+                    flush_u1q(qubit)
+                a, b = gate.target_indices
+                angle = np.pi / 2 if gate.name == "ZZ" else gate.params[0]
+                pair = (min(a, b), max(a, b))
+                pending_zz[pair] = pending_zz.get(pair, 0.0) + angle
+            else:
+                qubits = set(gate.target_indices) | set(gate.control_indices)
+                flush_zz(qubits)
+                for qubit in sorted(qubits):
+                    rz = flush(qubit)
+                    if rz is not None:
+                        gates.append(rz)
+                gates.append(gate)
+
+        flush_zz(set(range(circuit.qubit_count)))
+        final_rz = [flush(qubit) for qubit in sorted(pending)]
+        return _insert_final_rz(
+            circuit.qubit_count, gates, [rz for rz in final_rz if rz is not None]
+        )
+
+
+_IDENTITY = np.eye(2, dtype=np.complex128)
+
+
+def _insert_final_rz(
+    qubit_count: int, gates: Sequence[QuantumGate], final_rz: Sequence[QuantumGate]
+) -> NonParametricQuantumCircuit:
+    """Returns a circuit of the given gates followed by RZ gates, each of which is
+    moved back across the ZZ and RZZ gates at the end of its qubit into an idle
+    layer if any, so that it does not increase the depth."""
+    layers: list[int] = []
+    last_layer = [0] * qubit_count
+    for gate in gates:
+        layer = max(last_layer[q] for q in gate.target_indices) + 1
+        for q in gate.target_indices:
+            last_layer[q] = layer
+        layers.append(layer)
+
+    insertions: list[tuple[int, QuantumGate]] = []
+    for rz in final_rz:
+        qubit = rz.target_indices[0]
+        position = len(gates)
+        indices = [i for i, gate in enumerate(gates) if qubit in gate.target_indices]
+        for k in range(len(indices) - 1, -1, -1):
+            if gates[indices[k]].name not in ("ZZ", "RZZ"):
+                break
+            previous_layer = layers[indices[k - 1]] if k > 0 else 0
+            if layers[indices[k]] > previous_layer + 1:
+                position = indices[k]
+                break
+        insertions.append((position, rz))
+
+    ret = QuantumCircuit(qubit_count)
+    insertions.sort(key=lambda insertion: insertion[0])
+    n = 0
+    for i, gate in enumerate(gates):
+        while n < len(insertions) and insertions[n][0] == i:
+            ret.add_gate(insertions[n][1])
+            n += 1
+        ret.add_gate(gate)
+    for _, rz in insertions[n:]:
+        ret.add_gate(rz)
+    return ret
+
+
+def _rz_matrix(angle: float) -> npt.NDArray[np.complex128]:
+    return np.diag([complex_exp(-angle / 2), complex_exp(angle / 2)])
+
+
+def _normalize_angle(angle: float) -> float:
+    return float((angle + np.pi) % (2 * np.pi) - np.pi)
+
+
+def _rz_u1q_angles(
+    matrix: npt.NDArray[np.complex128], epsilon: float
+) -> tuple[float, float, float]:
+    """Returns (alpha, theta, phi) such that the given single qubit unitary is
+    RZ(alpha) U1q(theta, phi) up to a global phase, with 0 <= theta <= pi."""
+    su = matrix / np.sqrt(np.linalg.det(matrix))
+    a, b = su[0, 0], su[0, 1]
+    theta = float(2 * np.arctan2(abs(b), abs(a)))
+    if abs(b) < epsilon:
+        return float(-2 * np.angle(a)), 0.0, 0.0
+    alpha = 0.0 if abs(a) < epsilon else float(-2 * np.angle(a))
+    phi = float(-np.pi / 2 - alpha / 2 - np.angle(b))
+    return alpha, theta, phi
+
+
+QuantinuumPeepholeSetTranspiler: Callable[
+    [], CircuitTranspiler
+] = lambda: SequentialTranspiler(
+    [QuantinuumSetTranspiler(), QuantinuumPeepholeTranspiler()]
+)
+
+
+def native_inverse_gates(gate: QuantumGate) -> Sequence[QuantumGate]:
+    """Returns native gates whose product is the inverse of a given native gate of
+    the sc (X, SX, RZ, CNOT) or it (U1q, ZZ, RZZ, RZ) hardware, up to a global
+    phase."""
+    if gate.name in (gate_names.X, gate_names.CNOT, gate_names.Identity):
+        return [gate]
+    elif gate.name == gate_names.SqrtX:
+        #: SX^dagger = SX^3 = X SX
+        target = gate.target_indices[0]
+        return [SqrtX(target), X(target)]
+    elif gate.name == gate_names.RZ:
+        return [RZ(gate.target_indices[0], -gate.params[0])]
+    elif gate.name == "U1q":
+        theta, phi = gate.params
+        return [U1q(gate.target_indices[0], theta, phi + np.pi)]
+    elif gate.name == "ZZ":
+        i, j = gate.target_indices
+        return [RZZ(i, j, -np.pi / 2)]
+    elif gate.name == "RZZ":
+        i, j = gate.target_indices
+        return [RZZ(i, j, -gate.params[0])]
+    raise ValueError(f"Invalid native gate name: {gate.name}")
+
+
+def fold_native_circuit(
+    circuit: NonParametricQuantumCircuit,
+    scale_factor: float,
+    folding_method: "FoldingMethod",
+) -> NonParametricQuantumCircuit:
+    """Returns a circuit scaled for zero noise extrapolation by folding each gate
+    G of an already transpiled native circuit into G (G^dagger G)^k.
+
+    Unlike :func:`quri_parts.algo.mitigation.zne.scaling_circuit_folding`, the
+    inverses are built from native gates, so the folded circuit does not need to
+    be transpiled again. As for it, all gates are folded when the scale factor is
+    odd, and the gates selected by ``folding_method`` are folded once more.
+    """
+    scaled_circuit = QuantumCircuit(circuit.qubit_count)
+    num_folding_allgates = int((scale_factor - 1) / 2)
+    add_gate_set = set(folding_method(circuit, scale_factor))
+
+    for i, gate in enumerate(circuit.gates):
+        inv_gates = native_inverse_gates(gate)
+        scaled_circuit.add_gate(gate)
+        for _ in range(num_folding_allgates + (i in add_gate_set)):
+            scaled_circuit.extend(inv_gates)
+            scaled_circuit.add_gate(gate)
+    return scaled_circuit
+
+
 if __name__ == "__main__":
     pass
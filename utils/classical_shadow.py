@@ -0,0 +1,264 @@
+from collections.abc import Iterable, Sequence
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+from quri_parts.circuit import NonParametricQuantumCircuit, QuantumCircuit, QuantumGate
+from quri_parts.circuit.transpile import CircuitTranspiler
+from quri_parts.core.estimator import Estimatable, Estimate
+from quri_parts.core.estimator.sampling.estimator import _ConstEstimate
+from quri_parts.core.operator import PAULI_IDENTITY, Operator
+from quri_parts.core.sampling import ConcurrentSampler
+from quri_parts.core.state import CircuitQuantumState
+
+from utils.measurement_counts import ArrayMeasurementCounts
+from utils.sampling_estimator import (
+    _hardware_transpiler,
+    _PlainEstimate,
+    _sample_transpiled,
+)
+
+#: Codes of the local measurement bases, the same as the Pauli ids of QURI Parts.
+X_BASIS, Y_BASIS, Z_BASIS = 1, 2, 3
+
+
+def random_pauli_bases(
+    qubit_count: int, n_bases: int, rng: np.random.Generator
+) -> npt.NDArray[np.uint8]:
+    """Returns ``n_bases`` uniformly random local Pauli measurement bases as rows
+    of the basis codes of the qubits.
+
+    Measuring in a random Pauli basis of each qubit is measuring in a random
+    single qubit Clifford basis, since both give the same classical shadow.
+    """
+    return rng.integers(
+        X_BASIS, Z_BASIS + 1, size=(n_bases, qubit_count), dtype=np.uint8
+    )
+
+
+def covering_bases(
+    paulis: npt.NDArray[np.uint8], rng: np.random.Generator
+) -> npt.NDArray[np.uint8]:
+    """Returns local Pauli bases such that every Pauli string, given as a row of
+    the Pauli ids of the qubits (0 for identity), matches one of them on its
+    support.
+
+    The strings are merged greedily, in the order of decreasing weight, into
+    bitwise commuting groups, and each group is measured in one basis. The qubits
+    on which no string of a group acts are measured in random bases.
+    """
+    qubit_count = paulis.shape[1]
+    bases: list[npt.NDArray[np.uint8]] = []
+    weights = np.count_nonzero(paulis, axis=1)
+    for pauli in paulis[np.argsort(-weights, kind="stable")]:
+        for basis in bases:
+            if np.all((basis == 0) | (pauli == 0) | (basis == pauli)):
+                basis[pauli > 0] = pauli[pauli > 0]
+                break
+        else:
+            bases.append(pauli.copy())
+    if not bases:
+        return np.zeros((0, qubit_count), dtype=np.uint8)
+    covering = np.array(bases, dtype=np.uint8)
+    free = covering == 0
+    covering[free] = random_pauli_bases(qubit_count, len(bases), rng)[free]
+    return covering
+
+
+class ShadowSuffixes:
+    """Transpiled measurement suffixes of local Pauli bases.
+
+    The gates rotating a qubit from the X or Y basis to the Z basis are transpiled
+    once for each qubit, and the measurement circuit of a basis is composed of
+    the transpiled state circuit and these gates without further transpilation.
+    This requires a transpiler which leaves each qubit on its own index at the
+    end of the circuit, which is not the case for routing with relabeling.
+
+    Args:
+        transpiler: A :class:`~CircuitTranspiler` of the hardware.
+    """
+
+    def __init__(self, transpiler: CircuitTranspiler):
+        self._transpiler = transpiler
+        self._gates: dict[tuple[int, int], Sequence[QuantumGate]] = {}
+
+    def gates(self, qubit: int, basis: int) -> Sequence[QuantumGate]:
+        key = (qubit, basis)
+        if key not in self._gates:
+            qubit_bases = np.full(qubit + 1, Z_BASIS, dtype=np.uint8)
+            qubit_bases[qubit] = basis
+            circuit = basis_measurement_circuit(qubit + 1, qubit_bases)
+            self._gates[key] = self._transpiler(circuit).gates
+        return self._gates[key]
+
+    def circuit(
+        self,
+        transpiled_state_circuit: NonParametricQuantumCircuit,
+        basis: npt.NDArray[np.uint8],
+    ) -> NonParametricQuantumCircuit:
+        circuit = QuantumCircuit(
+            transpiled_state_circuit.qubit_count, gates=transpiled_state_circuit.gates
+        )
+        for qubit, qubit_basis in enumerate(basis.tolist()):
+            circuit.extend(self.gates(qubit, qubit_basis))
+        return circuit
+
+
+def basis_measurement_circuit(
+    qubit_count: int, basis: npt.NDArray[np.uint8]
+) -> NonParametricQuantumCircuit:
+    """Returns the (not transpiled) circuit rotating each qubit from its basis to
+    the Z basis."""
+    circuit = QuantumCircuit(qubit_count)
+    for qubit, qubit_basis in enumerate(basis.tolist()):
+        if qubit_basis == Y_BASIS:
+            circuit.add_Sdag_gate(qubit)
+        if qubit_basis != Z_BASIS:
+            circuit.add_H_gate(qubit)
+    return circuit
+
+
+def classical_shadow_estimate_gc(
+    op: Estimatable,
+    state: CircuitQuantumState,
+    total_shots: int,
+    n_bases: int,
+    sampler: ConcurrentSampler,
+    hardware_type: str,
+    n_groups: int = 8,
+    transpiler: Optional[CircuitTranspiler] = None,
+    suffixes: Optional[ShadowSuffixes] = None,
+    rng: Optional[np.random.Generator] = None,
+) -> tuple[Estimate[complex], Iterable[tuple[NonParametricQuantumCircuit, int]]]:
+    """Estimate expectation value of a given operator with a given state by
+    randomized measurement (classical shadow).
+
+    ``n_bases`` random local Pauli bases are drawn, and the terms of the operator
+    which none of them matches on its support are measured in additional bases
+    of bitwise commuting groups (see :func:`covering_bases`). The total shots
+    are distributed evenly to all the bases. Every term is reconstructed from the
+    snapshots of the bases matching it on its support: given that the basis
+    matches, the parity of the outcomes on the support is an unbiased sample of
+    the term, however the basis was chosen, so no term is estimated from
+    unmatched snapshots weighted by :math:`3^{|support|}`. The bases are split
+    into ``n_groups`` groups, and the value of each term is the median of its
+    means over the groups with matching snapshots. The standard error neglects
+    the covariances of the terms.
+
+    If ``total_shots`` is less than the number of bases, only the first
+    ``total_shots`` bases are measured. Terms which are then left unmatched are
+    estimated as 0, and their worst-case bias, the sum of the absolute values of
+    their coefficients, is added to the standard error.
+
+    Args:
+        op: An operator of which expectation value is estimated.
+        state: A quantum state on which the operator expectation is evaluated.
+        total_shots: Total number of shots available for sampling measurements.
+        n_bases: Number of random measurement bases.
+        sampler: a :class:`~ConcurrentSampler` that actually performs the sampling.
+        hardware_type: "sc" for super conducting, "it" for iontrap type hardware.
+        n_groups: Number of groups of the median of means.
+        transpiler: A :class:`~CircuitTranspiler` that transpiles the circuits to
+            the native gates of the hardware. The default transpiler of
+            ``hardware_type`` is used if omitted.
+        suffixes: :class:`ShadowSuffixes` of ``transpiler``. If omitted, the
+            measurement circuit of each basis is transpiled as a whole.
+        rng: A random number generator drawing the bases.
+
+    Returns:
+        The estimated value (can be accessed with :attr:`.value`) with standard error
+        of estimation (can be accessed with :attr:`.error`) and circuit and shots.
+
+    Raises:
+        ValueError: If ``total_shots`` or ``n_bases`` is not positive.
+    """
+    if total_shots <= 0:
+        raise ValueError("total_shots must be positive.")
+    if n_bases <= 0:
+        raise ValueError("n_bases must be positive.")
+
+    if transpiler is None:
+        transpiler = _hardware_transpiler(hardware_type)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if not isinstance(op, Operator):
+        op = Operator({op: 1.0})
+
+    if len(op) == 0:
+        circuit_shots = [(state.circuit, total_shots)]
+        return _ConstEstimate(0.0), circuit_shots
+
+    const: complex = 0.0
+    if PAULI_IDENTITY in op:
+        const = op[PAULI_IDENTITY]
+        if len(op) == 1:
+            circuit_shots = [(state.circuit, total_shots)]
+            return _ConstEstimate(const), circuit_shots
+
+    qubit_count = state.qubit_count
+    labels = [label for label in op if label != PAULI_IDENTITY]
+    coefs = np.array([op[label] for label in labels], dtype=complex)
+    paulis = np.zeros((len(labels), qubit_count), dtype=np.uint8)
+    for i, label in enumerate(labels):
+        indices, pauli_ids = label.index_and_pauli_id_list
+        paulis[i, indices] = pauli_ids
+    support = paulis > 0
+
+    def matching(bases: npt.NDArray[np.uint8]) -> npt.NDArray[np.bool_]:
+        matches: npt.NDArray[np.bool_] = np.all(
+            ~support | (paulis == bases[:, None, :]), axis=2
+        )
+        return matches
+
+    bases = random_pauli_bases(qubit_count, min(n_bases, total_shots), rng)
+    unmatched = ~matching(bases).any(axis=0)
+    bases = np.concatenate([bases, covering_bases(paulis[unmatched], rng)])
+    bases = bases[:total_shots]
+    n_bases = len(bases)
+    shots = np.full(n_bases, total_shots // n_bases)
+    shots[: total_shots % n_bases] += 1
+    matches = matching(bases)
+
+    if suffixes is not None:
+        transpiled_state_circuit = transpiler(state.circuit)
+        circuits = [suffixes.circuit(transpiled_state_circuit, b) for b in bases]
+    else:
+        circuits = [
+            transpiler(state.circuit + basis_measurement_circuit(qubit_count, b))
+            for b in bases
+        ]
+    circuit_and_shots = list(zip(circuits, shots.tolist()))
+    sampling_counts = [
+        ArrayMeasurementCounts.from_mapping(counts)
+        for counts in _sample_transpiled(sampler, circuit_and_shots, hardware_type)
+    ]
+
+    bitstrings = np.concatenate([c.bitstrings for c in sampling_counts])
+    counts = np.concatenate([c.counts for c in sampling_counts])
+    offsets = np.cumsum([0] + [len(c.bitstrings) for c in sampling_counts[:-1]])
+    bits = (bitstrings[:, None] >> np.arange(qubit_count, dtype=np.uint64)) & 1
+    parities = (bits.astype(np.int64) @ support.T.astype(np.int64)) & 1
+    signed_counts = counts[:, None] * (1 - 2 * parities)
+    basis_sums = np.add.reduceat(signed_counts, offsets, axis=0) * matches
+    basis_shots = shots[:, None] * matches
+
+    n_groups = max(1, min(n_groups, n_bases))
+    group_offsets = np.linspace(0, n_bases, n_groups + 1).astype(int)[:-1]
+    group_sums = np.add.reduceat(basis_sums, group_offsets, axis=0)
+    group_shots = np.add.reduceat(basis_shots, group_offsets, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        group_means = group_sums / group_shots
+    # groups without any matching snapshot are left out of the median
+    matched = group_shots.sum(axis=0) > 0
+    term_values = np.zeros(len(labels))
+    term_values[matched] = np.nanmedian(group_means[:, matched], axis=0)
+
+    term_shots = np.maximum(group_shots.sum(axis=0), 1)
+    term_variances = np.where(matched, 1 - term_values**2, 0.0) / term_shots
+    value = const + np.dot(coefs, term_values)
+    # terms which no measured basis matches are estimated as 0, which is off by
+    # at most the absolute value of their coefficients
+    bias = float(np.sum(np.abs(coefs[~matched])))
+    error = float(np.sqrt(np.dot(np.abs(coefs) ** 2, term_variances) + bias**2))
+    return _PlainEstimate(value, error), circuit_and_shots
@@ -0,0 +1,362 @@
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import TYPE_CHECKING, Any, Generic, Optional, TypeVar, Union
+
+from quri_parts.circuit import (
+    CONST,
+    LinearMappedUnboundParametricQuantumCircuit,
+    NonParametricQuantumCircuit,
+    Parameter,
+    QuantumCircuit,
+    UnitaryMatrix,
+    gate_names,
+)
+from quri_parts.core.estimator import Estimatable
+from quri_parts.core.operator import Operator, PauliLabel
+
+if TYPE_CHECKING:
+    from cirq import Circuit as CirqCircuit
+    from cirq import PauliString, PauliSum
+    from qiskit.circuit import QuantumCircuit as QiskitQuantumCircuit
+    from qiskit.opflow import PauliOp, PauliSumOp
+
+#: Circuits accepted by :class:`ConversionCache`.
+ConvertibleCircuit = Union[
+    NonParametricQuantumCircuit, "QiskitQuantumCircuit", "CirqCircuit"
+]
+
+#: Operators accepted by :class:`ConversionCache`.
+ConvertibleOperator = Union[
+    Estimatable, "PauliSumOp", "PauliOp", "PauliSum", "PauliString[Any]"
+]
+
+T = TypeVar("T")
+
+
+def _module_attr(module_name: str, attr: str) -> Optional[type]:
+    # an object can only be an instance of a class of a module already imported,
+    # so that Qiskit and Cirq are not imported just to check the type
+    module = sys.modules.get(module_name)
+    return getattr(module, attr, None) if module is not None else None
+
+
+def _is_instance(obj: object, module_name: str, *attrs: str) -> bool:
+    for attr in attrs:
+        cls = _module_attr(module_name, attr)
+        if cls is not None and isinstance(obj, cls):
+            return True
+    return False
+
+
+class _IdentityStructureCache(Generic[T]):
+    """A cache keyed by the identity of objects, backed by a cache keyed by their
+    structure.
+
+    An identity entry holds a weak reference to the object and a cheap
+    ``version`` of it (e.g. the number of instructions) to detect in-place
+    modifications, and is dropped when the object is garbage collected.
+
+    The cache may be used from multiple threads, e.g. by the simulations of
+    :class:`~utils.async_sampling.AsyncChallengeSampling`. The lock is reentrant
+    since the garbage collector may drop an entry while the lock is held.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._by_id: dict[int, tuple[weakref.ref[Any], Hashable, T]] = {}
+        self._by_key: OrderedDict[Hashable, T] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_by_id(self, obj: object, version: Hashable) -> Optional[T]:
+        with self._lock:
+            entry = self._by_id.get(id(obj))
+        if entry is None or entry[0]() is not obj or entry[1] != version:
+            return None
+        return entry[2]
+
+    def put_by_id(self, obj: object, version: Hashable, value: T) -> None:
+        obj_id = id(obj)
+        by_id = self._by_id
+        lock = self._lock
+
+        def remove(_: weakref.ref[Any]) -> None:
+            with lock:
+                entry = by_id.get(obj_id)
+                if entry is not None and entry[0]() is None:
+                    del by_id[obj_id]
+
+        try:
+            ref = weakref.ref(obj, remove)
+        except TypeError:
+            return
+        with lock:
+            by_id[obj_id] = (ref, version, value)
+            if len(by_id) > self._maxsize:
+                by_id.pop(next(iter(by_id)), None)
+
+    def get_by_key(self, key: Hashable) -> Optional[T]:
+        with self._lock:
+            value = self._by_key.get(key)
+            if value is not None:
+                self._by_key.move_to_end(key)
+        return value
+
+    def put_by_key(self, key: Hashable, value: T) -> None:
+        with self._lock:
+            self._by_key[key] = value
+            if len(self._by_key) > self._maxsize:
+                self._by_key.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_id.clear()
+            self._by_key.clear()
+
+
+class ConversionCache:
+    """Cache of the conversions of Qiskit and Cirq circuits and operators into
+    QURI Parts ones.
+
+    An object is looked up by its identity first and then by its structure:
+
+    * Qiskit circuits by their instructions without parameter values. On a hit,
+      the parameter values are rebound to the converted gates, so that a circuit
+      returned by ``assign_parameters`` in an optimization loop is not converted
+      again.
+    * Cirq circuits by their operations.
+    * Qiskit and Cirq operators by their Pauli strings and coefficients.
+
+    Parameterized Qiskit circuits can be converted once into parametric circuits
+    with :meth:`parametric_circuit` and bound to each parameter set.
+
+    The identity lookup of a circuit checks the number of instructions, so that
+    appending gates to a cached circuit is detected. Other in-place modifications
+    are not, and :meth:`clear` should be called after them. The returned objects
+    are shared and must not be modified.
+
+    Args:
+        maxsize: Maximum number of entries of each cache.
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self._circuits: _IdentityStructureCache[
+            NonParametricQuantumCircuit
+        ] = _IdentityStructureCache(maxsize)
+        self._parametric_circuits: _IdentityStructureCache[
+            LinearMappedUnboundParametricQuantumCircuit
+        ] = _IdentityStructureCache(maxsize)
+        self._operators: _IdentityStructureCache[Operator] = _IdentityStructureCache(
+            maxsize
+        )
+
+    def circuit(self, circuit: ConvertibleCircuit) -> NonParametricQuantumCircuit:
+        """Converts a Qiskit or Cirq circuit. QURI Parts circuits are returned as
+        they are."""
+        if isinstance(circuit, NonParametricQuantumCircuit):
+            return circuit
+        if _is_instance(circuit, "qiskit.circuit", "QuantumCircuit"):
+            return self._qiskit_circuit(circuit)
+        if _is_instance(circuit, "cirq", "Circuit"):
+            return self._cirq_circuit(circuit)
+        raise ValueError(f"Unsupported circuit type: {type(circuit)}")
+
+    def operator(self, operator: ConvertibleOperator) -> Estimatable:
+        """Converts a Qiskit or Cirq operator. QURI Parts operators and Pauli
+        labels are returned as they are."""
+        if isinstance(operator, (Operator, PauliLabel)):
+            return operator
+        if _is_instance(operator, "qiskit.opflow", "PauliSumOp", "PauliOp"):
+            return self._qiskit_operator(operator)
+        if _is_instance(operator, "cirq", "PauliSum", "PauliString"):
+            return self._cirq_operator(operator)
+        raise ValueError(f"Unsupported operator type: {type(operator)}")
+
+    def parametric_circuit(
+        self, circuit: "QiskitQuantumCircuit"
+    ) -> LinearMappedUnboundParametricQuantumCircuit:
+        """Converts a parameterized Qiskit circuit into a parametric circuit.
+
+        The parameters of the returned circuit are ordered as
+        ``circuit.parameters``, i.e. in the order in which ``assign_parameters``
+        binds a sequence of values. Parameters may appear in RX, RY and RZ gates
+        as linear expressions.
+        """
+        version = len(circuit.data)
+        cached = self._parametric_circuits.get_by_id(circuit, version)
+        if cached is not None:
+            return cached
+
+        key = (
+            circuit.num_qubits,
+            tuple(p.name for p in circuit.parameters),
+            tuple(
+                (
+                    inst.operation.name,
+                    tuple(circuit.find_bit(q).index for q in inst.qubits),
+                    tuple(str(p) for p in inst.operation.params),
+                )
+                for inst in circuit.data
+            ),
+        )
+        parametric = self._parametric_circuits.get_by_key(key)
+        if parametric is None:
+            parametric = _parametric_circuit_from_qiskit(circuit)
+            self._parametric_circuits.put_by_key(key, parametric)
+        self._parametric_circuits.put_by_id(circuit, version, parametric)
+        return parametric
+
+    def clear(self) -> None:
+        self._circuits.clear()
+        self._parametric_circuits.clear()
+        self._operators.clear()
+
+    def _qiskit_circuit(
+        self, circuit: "QiskitQuantumCircuit"
+    ) -> NonParametricQuantumCircuit:
+        from quri_parts.qiskit.circuit import circuit_from_qiskit
+
+        if circuit.parameters:
+            raise ValueError(
+                "Qiskit circuits with unbound parameters can not be sampled. "
+                "Use ConversionCache.parametric_circuit instead."
+            )
+        version = len(circuit.data)
+        cached = self._circuits.get_by_id(circuit, version)
+        if cached is not None:
+            return cached
+
+        instructions = circuit.data
+        indices = {q: i for i, q in enumerate(circuit.qubits)}
+        key = (
+            "qiskit",
+            circuit.num_qubits,
+            tuple(
+                (
+                    inst.operation.name,
+                    tuple(indices[q] for q in inst.qubits),
+                    len(inst.operation.params),
+                )
+                for inst in instructions
+            ),
+        )
+        template = self._circuits.get_by_key(key)
+        if template is None:
+            converted: NonParametricQuantumCircuit = circuit_from_qiskit(
+                circuit
+            ).freeze()
+            self._circuits.put_by_key(key, converted)
+        else:
+            # rebind the parameter values of the gates converted from a circuit of
+            # the same structure
+            gates = []
+            for gate, inst in zip(template.gates, instructions):
+                params = inst.operation.params
+                if not params:
+                    gates.append(gate)
+                elif gate.name == gate_names.UnitaryMatrix:
+                    gates.append(
+                        UnitaryMatrix(gate.target_indices, inst.operation.to_matrix())
+                    )
+                else:
+                    gates.append(gate._replace(params=tuple(params)))
+            converted = QuantumCircuit(template.qubit_count, gates=gates).freeze()
+        self._circuits.put_by_id(circuit, version, converted)
+        return converted
+
+    def _cirq_circuit(self, circuit: "CirqCircuit") -> NonParametricQuantumCircuit:
+        from quri_parts.cirq.circuit import circuit_from_cirq
+
+        operations = tuple(circuit.all_operations())
+        cached = self._circuits.get_by_id(circuit, len(operations))
+        if cached is not None:
+            return cached
+
+        key = ("cirq", operations)
+        converted = self._circuits.get_by_key(key)
+        if converted is None:
+            converted = circuit_from_cirq(circuit).freeze()
+            self._circuits.put_by_key(key, converted)
+        self._circuits.put_by_id(circuit, len(operations), converted)
+        return converted
+
+    def _qiskit_operator(self, operator: Union["PauliSumOp", "PauliOp"]) -> Operator:
+        from quri_parts.qiskit.operator import operator_from_qiskit_op
+
+        # Qiskit operators are immutable
+        cached = self._operators.get_by_id(operator, None)
+        if cached is not None:
+            return cached
+
+        if _is_instance(operator, "qiskit.opflow", "PauliSumOp"):
+            key: Hashable = (
+                "qiskit",
+                tuple(operator.primitive.paulis.to_labels()),
+                operator.primitive.coeffs.tobytes(),
+                operator.coeff,
+            )
+        else:
+            key = ("qiskit", str(operator.primitive), operator.coeff)
+        converted = self._operators.get_by_key(key)
+        if converted is None:
+            converted = operator_from_qiskit_op(operator)
+            self._operators.put_by_key(key, converted)
+        self._operators.put_by_id(operator, None, converted)
+        return converted
+
+    def _cirq_operator(
+        self, operator: Union["PauliSum", "PauliString[Any]"]
+    ) -> Operator:
+        from quri_parts.cirq.operator import operator_from_cirq_op
+
+        # Cirq Pauli strings are hashable, including their coefficients
+        if _is_instance(operator, "cirq", "PauliString"):
+            key: Hashable = ("cirq", (operator,))
+        else:
+            key = ("cirq", tuple(operator))
+        converted = self._operators.get_by_key(key)
+        if converted is None:
+            converted = operator_from_cirq_op(operator)
+            self._operators.put_by_key(key, converted)
+        return converted
+
+
+def _parametric_circuit_from_qiskit(
+    circuit: "QiskitQuantumCircuit",
+) -> LinearMappedUnboundParametricQuantumCircuit:
+    from qiskit.circuit import ParameterExpression
+    from quri_parts.qiskit.circuit import circuit_from_qiskit
+
+    parametric = LinearMappedUnboundParametricQuantumCircuit(circuit.num_qubits)
+    qiskit_params = list(circuit.parameters)
+    params = dict(
+        zip(qiskit_params, parametric.add_parameters(*(p.name for p in qiskit_params)))
+    )
+    add_parametric_gate: dict[str, Callable[[int, Any], None]] = {
+        gate_names.RX: parametric.add_ParametricRX_gate,
+        gate_names.RY: parametric.add_ParametricRY_gate,
+        gate_names.RZ: parametric.add_ParametricRZ_gate,
+    }
+    # circuit_from_qiskit converts each instruction into a gate, leaving parameter
+    # expressions as they are
+    for gate in circuit_from_qiskit(circuit).gates:
+        expressions = [p for p in gate.params if isinstance(p, ParameterExpression)]
+        if not expressions:
+            parametric.add_gate(gate)
+            continue
+        if gate.name not in add_parametric_gate:
+            raise ValueError(f"Parametric {gate.name} gates are not supported.")
+        (expression,) = expressions
+        angle: dict[Parameter, float] = {}
+        for qiskit_param in expression.parameters:
+            coeff = expression.gradient(qiskit_param)
+            if isinstance(coeff, ParameterExpression):
+                raise ValueError(f"Non-linear parameter expression: {expression}")
+            angle[params[qiskit_param]] = float(coeff)
+        const = float(expression.bind({p: 0.0 for p in expression.parameters}))
+        if const != 0.0:
+            angle[CONST] = const
+        add_parametric_gate[gate.name](gate.target_indices[0], angle)
+    return parametric
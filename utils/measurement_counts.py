@@ -0,0 +1,191 @@
+from collections.abc import ItemsView, Iterable, Iterator, Mapping, ValuesView
+from typing import Union
+
+import numpy as np
+import numpy.typing as npt
+from numpy.random import default_rng
+from quri_parts.circuit import NonParametricQuantumCircuit
+from quri_parts.circuit.noise import NoiseModel
+from quri_parts.core.sampling import ConcurrentSampler, MeasurementCounts
+
+
+class ArrayMeasurementCounts(Mapping[int, Union[int, float]]):
+    """:class:`~MeasurementCounts` backed by two NumPy arrays.
+
+    ``bitstrings`` holds the sorted unique measured bitstrings as ``uint64`` and
+    ``counts`` the corresponding counts, ``int64`` for sampled counts and
+    ``float64`` for quasi-counts such as readout-mitigated ones. Lookups are
+    binary searches, and :meth:`items` and :meth:`values` iterate over the arrays
+    without hashing.
+
+    Args:
+        bitstrings: Sorted unique bitstrings.
+        counts: Counts of the bitstrings.
+    """
+
+    __slots__ = ("_bitstrings", "_counts")
+
+    def __init__(
+        self,
+        bitstrings: npt.ArrayLike,
+        counts: npt.ArrayLike,
+    ) -> None:
+        # read-only views, so that the arrays of the caller stay writable
+        bitstrings = np.asarray(bitstrings, dtype=np.uint64).view()
+        counts = np.asarray(counts).view()
+        if bitstrings.shape != counts.shape or bitstrings.ndim != 1:
+            raise ValueError(
+                "bitstrings and counts must be one-dimensional arrays of the same "
+                f"length, got shapes {bitstrings.shape} and {counts.shape}."
+            )
+        bitstrings.flags.writeable = False
+        counts.flags.writeable = False
+        self._bitstrings: npt.NDArray[np.uint64] = bitstrings
+        self._counts: npt.NDArray[Union[np.int64, np.float64]] = counts
+
+    @classmethod
+    def from_samples(cls, samples: npt.ArrayLike) -> "ArrayMeasurementCounts":
+        """Creates counts from a sequence of measured bitstrings."""
+        bitstrings, counts = np.unique(
+            np.asarray(samples, dtype=np.uint64), return_counts=True
+        )
+        return cls(bitstrings, counts.astype(np.int64))
+
+    @classmethod
+    def from_dense(cls, dense_counts: npt.ArrayLike) -> "ArrayMeasurementCounts":
+        """Creates counts from a vector whose i-th element is the count of
+        bitstring i. Zero entries are dropped."""
+        dense_counts = np.asarray(dense_counts)
+        (bitstrings,) = np.nonzero(dense_counts)
+        return cls(bitstrings, dense_counts[bitstrings])
+
+    @classmethod
+    def from_mapping(cls, counts: MeasurementCounts) -> "ArrayMeasurementCounts":
+        """Converts any :class:`~MeasurementCounts`. Instances of this class are
+        returned as they are."""
+        if isinstance(counts, ArrayMeasurementCounts):
+            return counts
+        bitstrings = np.fromiter(counts.keys(), dtype=np.uint64, count=len(counts))
+        values = np.array(list(counts.values()))
+        order = np.argsort(bitstrings)
+        return cls(bitstrings[order], values[order])
+
+    @property
+    def bitstrings(self) -> npt.NDArray[np.uint64]:
+        """Read-only view of the sorted unique bitstrings."""
+        return self._bitstrings
+
+    @property
+    def counts(self) -> npt.NDArray[Union[np.int64, np.float64]]:
+        """Read-only view of the counts corresponding to :attr:`bitstrings`."""
+        return self._counts
+
+    @property
+    def total(self) -> Union[int, float]:
+        """Sum of the counts."""
+        return self._counts.sum().item()  # type: ignore
+
+    def _index(self, key: object) -> int:
+        if not isinstance(key, (int, np.integer)) or key < 0:
+            return -1
+        idx = int(np.searchsorted(self._bitstrings, np.uint64(key)))
+        if idx < len(self._bitstrings) and self._bitstrings[idx] == key:
+            return idx
+        return -1
+
+    def __getitem__(self, key: int) -> Union[int, float]:
+        idx = self._index(key)
+        if idx < 0:
+            raise KeyError(key)
+        return self._counts[idx].item()  # type: ignore
+
+    def __contains__(self, key: object) -> bool:
+        return self._index(key) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._bitstrings.tolist())
+
+    def __len__(self) -> int:
+        return len(self._bitstrings)
+
+    def items(self) -> ItemsView[int, Union[int, float]]:
+        return _ArrayItemsView(self)
+
+    def values(self) -> ValuesView[Union[int, float]]:
+        return _ArrayValuesView(self)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict(self.items())})"
+
+
+class _ArrayItemsView(ItemsView[int, Union[int, float]]):
+    _mapping: ArrayMeasurementCounts
+
+    def __iter__(self) -> Iterator[tuple[int, Union[int, float]]]:
+        return zip(self._mapping.bitstrings.tolist(), self._mapping.counts.tolist())
+
+
+class _ArrayValuesView(ValuesView[Union[int, float]]):
+    _mapping: ArrayMeasurementCounts
+
+    def __iter__(self) -> Iterator[Union[int, float]]:
+        return iter(self._mapping.counts.tolist())
+
+
+def _sample_vector(
+    circuit: NonParametricQuantumCircuit, shots: int
+) -> ArrayMeasurementCounts:
+    # qulacs is imported on first use, since it pulls in scipy.sparse
+    import qulacs
+    from quri_parts.qulacs.circuit import convert_circuit
+
+    qs_circuit = convert_circuit(circuit)
+    qs_state = qulacs.QuantumState(circuit.qubit_count)
+    qs_circuit.update_quantum_state(qs_state)
+
+    if shots > 2 ** max(qs_state.get_qubit_count(), 10):
+        # Use multinomial distribution for faster sampling
+        probs = np.abs(qs_state.get_vector()) ** 2
+        return ArrayMeasurementCounts.from_dense(
+            default_rng().multinomial(shots, probs / probs.sum())
+        )
+    return ArrayMeasurementCounts.from_samples(qs_state.sampling(shots))
+
+
+def create_array_vector_concurrent_sampler() -> ConcurrentSampler:
+    """Returns a :class:`~ConcurrentSampler` that uses Qulacs vector simulator
+    and returns :class:`ArrayMeasurementCounts`."""
+
+    def sampler(
+        circuit_shots_tuples: Iterable[tuple[NonParametricQuantumCircuit, int]]
+    ) -> Iterable[MeasurementCounts]:
+        return [_sample_vector(circuit, shots) for circuit, shots in circuit_shots_tuples]
+
+    return sampler
+
+
+def create_array_noisesimulator_concurrent_sampler(
+    model: NoiseModel,
+) -> ConcurrentSampler:
+    """Returns a :class:`~ConcurrentSampler` that uses Qulacs NoiseSimulator
+    and returns :class:`ArrayMeasurementCounts`."""
+
+    def _sample_with_noise(
+        circuit: NonParametricQuantumCircuit, shots: int
+    ) -> ArrayMeasurementCounts:
+        import qulacs
+        from quri_parts.qulacs.circuit.noise import convert_circuit_with_noise_model
+
+        qs_circuit = convert_circuit_with_noise_model(circuit, model)
+        state = qulacs.QuantumState(circuit.qubit_count)
+        sim = qulacs.NoiseSimulator(qs_circuit, state)
+        return ArrayMeasurementCounts.from_samples(sim.execute(shots))
+
+    def sampler(
+        circuit_shots_tuples: Iterable[tuple[NonParametricQuantumCircuit, int]]
+    ) -> Iterable[MeasurementCounts]:
+        return [
+            _sample_with_noise(circuit, shots) for circuit, shots in circuit_shots_tuples
+        ]
+
+    return sampler
@@ -0,0 +1,91 @@
+from collections.abc import Sequence
+
+import numpy as np
+import numpy.typing as npt
+from quri_parts.circuit import NonParametricQuantumCircuit, QuantumCircuit
+from quri_parts.core.sampling import MeasurementCounts
+
+from utils.measurement_counts import ArrayMeasurementCounts
+
+
+def readout_calibration_circuits(qubit_count: int) -> list[NonParametricQuantumCircuit]:
+    """Returns the 2n calibration circuits of the tensored readout error model.
+
+    For each qubit, a circuit preparing the qubit in :math:`|0\\rangle` (with an
+    identity gate, so that both circuits have the same depth) and one preparing
+    it in :math:`|1\\rangle` are returned in this order.
+    """
+    circuits: list[NonParametricQuantumCircuit] = []
+    for qubit in range(qubit_count):
+        prepare_zero = QuantumCircuit(qubit_count)
+        prepare_zero.add_Identity_gate(qubit)
+        prepare_one = QuantumCircuit(qubit_count)
+        prepare_one.add_X_gate(qubit)
+        circuits.extend([prepare_zero, prepare_one])
+    return circuits
+
+
+class TensoredReadoutCalibration:
+    """Readout error model in which each qubit is flipped independently.
+
+    Args:
+        assignment_matrices: Array of shape ``(n, 2, 2)`` whose element
+            ``[q, m, p]`` is the probability of measuring ``m`` on qubit ``q``
+            prepared in ``p``.
+    """
+
+    def __init__(self, assignment_matrices: npt.ArrayLike) -> None:
+        matrices = np.asarray(assignment_matrices, dtype=float)
+        if matrices.ndim != 3 or matrices.shape[1:] != (2, 2):
+            raise ValueError(
+                f"assignment_matrices must have shape (n, 2, 2), got {matrices.shape}."
+            )
+        self._assignment_matrices = matrices
+        self._inverse_matrices = np.linalg.inv(matrices)
+
+    @classmethod
+    def from_counts(
+        cls, calibration_counts: Sequence[MeasurementCounts]
+    ) -> "TensoredReadoutCalibration":
+        """Creates a calibration from the counts of the circuits returned by
+        :func:`readout_calibration_circuits`, in the same order."""
+        if len(calibration_counts) % 2 != 0:
+            raise ValueError("Two calibration counts are required for each qubit.")
+        qubit_count = len(calibration_counts) // 2
+        matrices = np.empty((qubit_count, 2, 2))
+        for qubit in range(qubit_count):
+            for prepared in (0, 1):
+                counts = ArrayMeasurementCounts.from_mapping(
+                    calibration_counts[2 * qubit + prepared]
+                )
+                bits = (counts.bitstrings >> np.uint64(qubit)) & np.uint64(1)
+                p_one = counts.counts[bits == 1].sum() / counts.counts.sum()
+                matrices[qubit, :, prepared] = (1.0 - p_one, p_one)
+        return cls(matrices)
+
+    @property
+    def qubit_count(self) -> int:
+        return len(self._assignment_matrices)
+
+    @property
+    def assignment_matrices(self) -> npt.NDArray[np.float64]:
+        return self._assignment_matrices
+
+    def mitigate(self, counts: MeasurementCounts) -> ArrayMeasurementCounts:
+        """Applies the per-qubit inverse assignment matrices to the given counts
+        and returns the mitigated quasi-counts.
+
+        The inverse maps act on the axes of the ``(2,) * n`` tensor of counts one
+        qubit at a time, so that the cost is :math:`O(n 2^n)` instead of that of
+        a :math:`2^n \\times 2^n` matrix.
+        """
+        array_counts = ArrayMeasurementCounts.from_mapping(counts)
+        n = self.qubit_count
+        dense = np.zeros(2**n)
+        dense[array_counts.bitstrings.astype(np.int64)] = array_counts.counts
+        tensor = dense.reshape((2,) * n)
+        for qubit, inverse in enumerate(self._inverse_matrices):
+            # the bit of qubit q is the (n - 1 - q)-th axis in C order
+            axis = n - 1 - qubit
+            tensor = np.moveaxis(np.tensordot(inverse, tensor, axes=(1, axis)), 0, axis)
+        return ArrayMeasurementCounts.from_dense(tensor.reshape(-1))
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse as sp
+from quri_parts.core.operator import Operator
+
+#: Name of the cache file of :func:`reference_energy` in the data directory.
+CACHE_FILE_NAME = "reference_energies.json"
+
+# below this dimension the dense eigensolver is faster than ARPACK
+_DENSE_DIMENSION = 256
+
+
+def _popcount(values: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+    counts = np.zeros_like(values)
+    values = values.copy()
+    while np.any(values):
+        counts += values & 1
+        values >>= 1
+    return counts
+
+
+def particle_number_basis(
+    qubit_count: int, n_electrons: int
+) -> npt.NDArray[np.int64]:
+    """Returns the computational basis states with ``n_electrons`` occupied
+    spin orbitals, i.e. qubits in :math:`|1\\rangle`, in increasing order."""
+    states = np.arange(2**qubit_count, dtype=np.int64)
+    basis: npt.NDArray[np.int64] = states[_popcount(states) == n_electrons]
+    return basis
+
+
+def sparse_hamiltonian(
+    operator: Operator,
+    qubit_count: int,
+    basis: Optional[npt.NDArray[np.int64]] = None,
+) -> tuple[sp.csr_matrix, bool]:
+    """Returns the sparse matrix of a qubit operator on the subspace spanned by
+    the computational basis states ``basis`` (all states if omitted).
+
+    Each Pauli term maps a basis state :math:`|b\\rangle` to
+    :math:`|b \\oplus x\\rangle` with a sign given by the parity of
+    :math:`b \\,\\&\\, z` and a phase :math:`i^{n_Y}`, where :math:`x` and
+    :math:`z` are the bit masks of its X/Y and Y/Z factors, so the matrix is
+    built for all terms at once without the Kronecker products.
+
+    Returns:
+        The matrix and whether the subspace is invariant under the operator. If
+        it is not, the matrix is the projection of the operator.
+    """
+    if basis is None:
+        basis = np.arange(2**qubit_count, dtype=np.int64)
+    n_terms = len(operator)
+    x_masks = np.zeros(n_terms, dtype=np.int64)
+    z_masks = np.zeros(n_terms, dtype=np.int64)
+    coefs = np.zeros(n_terms, dtype=complex)
+    for i, (label, coef) in enumerate(operator.items()):
+        n_y = 0
+        for index, pauli in label:
+            if pauli != 3:
+                x_masks[i] |= 1 << index
+            if pauli != 1:
+                z_masks[i] |= 1 << index
+            n_y += pauli == 2
+        coefs[i] = coef * 1j**n_y
+
+    cols = np.broadcast_to(np.arange(len(basis)), (n_terms, len(basis)))
+    targets = basis[None, :] ^ x_masks[:, None]
+    signs = 1 - 2 * (_popcount(basis[None, :] & z_masks[:, None]) & 1)
+    values = coefs[:, None] * signs
+
+    rows = np.searchsorted(basis, targets)
+    inside = rows < len(basis)
+    inside[inside] = basis[rows[inside]] == targets[inside]
+    matrix = sp.csr_matrix(
+        (values[inside], (rows[inside], cols[inside])),
+        shape=(len(basis), len(basis)),
+    )
+
+    # the terms leaving the subspace may cancel, e.g. X0 X1 + Y0 Y1
+    leak = sp.coo_matrix(
+        (values[~inside], (targets[~inside], cols[~inside])),
+        shape=(2**qubit_count, len(basis)),
+    ).tocsr()
+    leak.eliminate_zeros()
+    invariant = leak.nnz == 0 or bool(np.max(np.abs(leak.data)) < 1e-10)
+    return matrix, invariant
+
+
+def ground_state_energy(
+    operator: Operator, qubit_count: int, n_electrons: Optional[int] = None
+) -> float:
+    """Returns the exact ground state energy of a qubit operator.
+
+    If the operator conserves the particle number, the ground state is searched
+    in the sector with ``n_electrons`` electrons (half filling if omitted),
+    otherwise in the whole Hilbert space. The lowest eigenvalue is computed with
+    the Lanczos method of ARPACK, and with a dense eigensolver for small
+    dimensions or if ARPACK does not converge.
+    """
+    if n_electrons is None:
+        n_electrons = qubit_count // 2
+    basis = particle_number_basis(qubit_count, n_electrons)
+    matrix, invariant = sparse_hamiltonian(operator, qubit_count, basis)
+    if not invariant:
+        matrix, _ = sparse_hamiltonian(operator, qubit_count)
+
+    if matrix.shape[0] > _DENSE_DIMENSION:
+        from scipy.sparse.linalg import ArpackNoConvergence, eigsh
+
+        try:
+            return float(eigsh(matrix, k=1, which="SA", return_eigenvectors=False)[0])
+        except ArpackNoConvergence:
+            pass
+    return float(np.linalg.eigvalsh(matrix.toarray())[0])
+
+
+def _file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def reference_energy(
+    file_name: str,
+    data_directory: str,
+    n_electrons: Optional[int] = None,
+    plain_text: bool = False,
+    cache_path: Optional[str] = None,
+) -> float:
+    """Returns the exact ground state energy of a Hamiltonian file saved with
+    :func:`openfermion.utils.save_operator`, as used for ``ref_value`` of the
+    evaluation.
+
+    The Jordan-Wigner transformed Hamiltonian is diagonalized with
+    :func:`ground_state_energy`. Results are cached in a JSON file, by default
+    ``reference_energies.json`` in ``data_directory``, keyed by the SHA-256 hash
+    of the Hamiltonian file and the number of electrons, so that a modified file
+    is diagonalized again.
+    """
+    from openfermion.transforms import jordan_wigner
+    from openfermion.utils import count_qubits, get_file_path, load_operator
+    from quri_parts.openfermion.operator import operator_from_openfermion_op
+
+    file_path = get_file_path(file_name, data_directory)
+    if cache_path is None:
+        cache_path = os.path.join(data_directory, CACHE_FILE_NAME)
+    sector = "half_filling" if n_electrons is None else str(n_electrons)
+    key = f"{_file_hash(file_path)}:{sector}"
+
+    cache: dict[str, float] = {}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+    if key in cache:
+        return cache[key]
+
+    ham = load_operator(
+        file_name=file_name, data_directory=data_directory, plain_text=plain_text
+    )
+    qubit_count = count_qubits(ham)
+    hamiltonian = operator_from_openfermion_op(jordan_wigner(ham))
+    energy = ground_state_energy(hamiltonian, qubit_count, n_electrons)
+
+    cache[key] = energy
+    try:
+        with open(cache_path, "w") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+    except OSError:
+        pass
+    return energy
@@ -1,18 +1,31 @@
-from typing import Iterable
+from typing import TYPE_CHECKING, Callable, Iterable, NamedTuple, Optional, Sequence
 
+import numpy as np
+import numpy.typing as npt
 from quri_parts.circuit import NonParametricQuantumCircuit
+from quri_parts.circuit.transpile import CircuitTranspiler
 from quri_parts.core.estimator import Estimatable, Estimate
-from quri_parts.core.estimator.sampling.estimator import _ConstEstimate, _Estimate
-from quri_parts.core.measurement import CommutablePauliSetMeasurementFactory
-from quri_parts.core.operator import PAULI_IDENTITY, Operator
-from quri_parts.core.sampling import ConcurrentSampler, PauliSamplingShotsAllocator
+from quri_parts.core.estimator.sampling.estimator import _ConstEstimate
+from quri_parts.core.measurement import (
+    CommutablePauliSetMeasurement,
+    CommutablePauliSetMeasurementFactory,
+    bitwise_pauli_reconstructor_factory,
+)
+from quri_parts.core.operator import PAULI_IDENTITY, Operator, PauliLabel
+from quri_parts.core.sampling import (
+    ConcurrentSampler,
+    MeasurementCounts,
+    PauliSamplingShotsAllocator,
+)
 from quri_parts.core.state import CircuitQuantumState
-from quri_parts.quantinuum.circuit.transpile import QuantinuumSetTranspiler
 
-from utils.challenge_transpiler import (
-    SCSquareLatticeTranspiler,
-    quri_parts_iontrap_native_circuit,
-)
+from utils.measurement_counts import ArrayMeasurementCounts
+
+if TYPE_CHECKING:
+    from quri_parts.algo.mitigation.zne.zne import (
+        FoldingMethod,
+        ZeroExtrapolationMethod,
+    )
 
 
 def sampling_estimate_gc(
@@ -23,6 +36,7 @@ def sampling_estimate_gc(
     hardware_type: str,
     measurement_factory: CommutablePauliSetMeasurementFactory,
     shots_allocator: PauliSamplingShotsAllocator,
+    transpiler: Optional[CircuitTranspiler] = None,
 ) -> tuple[Estimate[complex], Iterable[tuple[NonParametricQuantumCircuit, int]]]:
     """Estimate expectation value of a given operator with a given state by
     sampling measurement.
@@ -39,17 +53,16 @@ def sampling_estimate_gc(
             a measurement scheme for Pauli operators constituting the original operator.
         shots_allocator: A function that allocates the total shots to Pauli groups to
             be measured.
+        transpiler: A :class:`~CircuitTranspiler` that transpiles the measurement
+            circuits to the native gates of the hardware. The default transpiler of
+            ``hardware_type`` is used if omitted.
 
     Returns:
         The estimated value (can be accessed with :attr:`.value`) with standard error
         of estimation (can be accessed with :attr:`.error`) and grouped circuit and shots.
     """
-    if hardware_type == "sc":
-        transpiler = SCSquareLatticeTranspiler()
-    elif hardware_type == "it":
-        transpiler = QuantinuumSetTranspiler()
-    else:
-        raise
+    if transpiler is None:
+        transpiler = _hardware_transpiler(hardware_type)
 
     if not isinstance(op, Operator):
         op = Operator({op: 1.0})
@@ -83,19 +96,442 @@ def sampling_estimate_gc(
     for _, circuit, shots in measurement_circuit_shots:
         circuit = transpiler(circuit)
         circuit_and_shots.append((circuit, shots))
-    if hardware_type == "sc":
-        sampling_counts = sampler(circuit_and_shots)
-    else:
-        circuit_and_shots_for_it_sampling = [
-            (quri_parts_iontrap_native_circuit(circuit), shots) for (circuit, shots) in circuit_and_shots
-        ]
-        sampling_counts = sampler(circuit_and_shots_for_it_sampling)
-
-    pauli_sets = tuple(m.pauli_set for m, _, _ in measurement_circuit_shots)
-    pauli_recs = tuple(
-        m.pauli_reconstructor_factory for m, _, _ in measurement_circuit_shots
+    sampling_counts = _sample_transpiled(sampler, circuit_and_shots, hardware_type)
+
+    measurements = [m for m, _, _ in measurement_circuit_shots]
+    estimate = _estimate_from_counts(op, const, measurements, sampling_counts)
+    return estimate, circuit_and_shots
+
+
+class _PlainEstimate(NamedTuple):
+    value: complex
+    error: float = np.nan
+
+
+def _pauli_values(
+    measurement: CommutablePauliSetMeasurement,
+    paulis: Sequence[PauliLabel],
+    bitstrings: npt.NDArray[np.uint64],
+) -> npt.NDArray[np.int64]:
+    """Returns the values of ``paulis`` (columns) reconstructed from the measured
+    ``bitstrings`` (rows).
+
+    For the bitwise commuting measurement the value of a Pauli is the parity of
+    the bits on its support, which is computed for all the bitstrings at once.
+    Other reconstructors are called for each bitstring.
+    """
+    factory = measurement.pauli_reconstructor_factory
+    if factory is not bitwise_pauli_reconstructor_factory:
+        recs = [factory(p) for p in paulis]
+        return np.array(
+            [[rec(key) for rec in recs] for key in bitstrings.tolist()],
+            dtype=np.int64,
+        ).reshape(len(bitstrings), len(paulis))
+    qubit_count = max(
+        (index + 1 for p in paulis for index in p.qubit_indices()), default=0
+    )
+    support = np.zeros((len(paulis), qubit_count), dtype=np.int64)
+    for i, pauli in enumerate(paulis):
+        support[i, list(pauli.qubit_indices())] = 1
+    bits = (bitstrings[:, None] >> np.arange(qubit_count, dtype=np.uint64)) & 1
+    parities = (bits.astype(np.int64) @ support.T) & 1
+    return 1 - 2 * parities
+
+
+def _group_values(
+    op: Operator,
+    measurement: CommutablePauliSetMeasurement,
+    counts: ArrayMeasurementCounts,
+) -> npt.NDArray[np.complex128]:
+    """Returns the values of the terms of ``op`` in the Pauli group of
+    ``measurement`` summed for each of the measured bitstrings."""
+    paulis = [p for p in measurement.pauli_set if p in op]
+    coefs = np.array([op[p] for p in paulis], dtype=complex)
+    values: npt.NDArray[np.complex128] = (
+        _pauli_values(measurement, paulis, counts.bitstrings) @ coefs
+    )
+    return values
+
+
+def _estimate_from_counts(
+    op: Operator,
+    const: complex,
+    measurements: Sequence[CommutablePauliSetMeasurement],
+    sampling_counts: Iterable[MeasurementCounts],
+) -> _PlainEstimate:
+    """Returns the estimate of ``op`` from the counts of the measurement circuits
+    of the Pauli groups, with the same value and error as the estimate of
+    QURI Parts."""
+    value, variance = const, 0.0
+    for measurement, counts in zip(measurements, sampling_counts):
+        array_counts = ArrayMeasurementCounts.from_mapping(counts)
+        values = _group_values(op, measurement, array_counts)
+        weights = array_counts.counts
+        n = weights.sum()
+        mean = np.dot(weights, values) / n
+        value += mean
+        variance += float(np.dot(weights, np.abs(values - mean) ** 2)) / n**2
+    return _PlainEstimate(complex(value), float(np.sqrt(variance)))
+
+
+class _GroupStatistics:
+    """Running mean and variance of the sampled values of a commuting Pauli group,
+    merged chunk by chunk (Chan et al.)."""
+
+    def __init__(
+        self,
+        op: Operator,
+        measurement: CommutablePauliSetMeasurement,
+    ) -> None:
+        self._op = op
+        self._measurement = measurement
+        self.n_shots = 0
+        self.mean: complex = 0.0
+        self._m2 = 0.0
+
+    def update(self, counts: MeasurementCounts) -> None:
+        array_counts = ArrayMeasurementCounts.from_mapping(counts)
+        values = _group_values(self._op, self._measurement, array_counts)
+        weights = array_counts.counts
+        n = weights.sum()
+        if n == 0:
+            return
+        mean = np.dot(weights, values) / n
+        m2 = float(np.dot(weights, np.abs(values - mean) ** 2))
+
+        total = self.n_shots + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += m2 + abs(delta) ** 2 * self.n_shots * n / total
+        self.n_shots = int(total)
+
+    @property
+    def variance_of_mean(self) -> float:
+        if self.n_shots < 2:
+            return np.inf
+        return self._m2 / (self.n_shots - 1) / self.n_shots
+
+
+def sequential_sampling_estimate_gc(
+    op: Estimatable,
+    state: CircuitQuantumState,
+    max_shots: int,
+    chunk_shots: int,
+    sampler: ConcurrentSampler,
+    hardware_type: str,
+    measurement_factory: CommutablePauliSetMeasurementFactory,
+    shots_allocator: PauliSamplingShotsAllocator,
+    target_error: Optional[float] = None,
+    time_budget: Optional[float] = None,
+    shot_time: Optional[Callable[[NonParametricQuantumCircuit], float]] = None,
+    transpiler: Optional[CircuitTranspiler] = None,
+) -> tuple[Estimate[complex], Iterable[tuple[NonParametricQuantumCircuit, int]]]:
+    """Estimate expectation value of a given operator with a given state by
+    sampling measurement in chunks until a stopping criterion is met.
+
+    Each round adds ``chunk_shots`` shots to the budget and samples the shots
+    that ``shots_allocator`` allocates to the Pauli groups for the whole budget
+    but that were not sampled yet (see :func:`sequential_shot_budgets`), so that
+    groups with allocations rounded down to 0 in a chunk are still sampled once
+    the budget grows. Every group is first sampled with 2 shots, in the order of
+    decreasing allocation, since the variance of a group with fewer shots is
+    unknown and the standard error is infinite until all the groups have been
+    sampled. The samples are merged into running means and variances of the
+    groups. Sampling stops when the standard error reaches ``target_error``, when
+    ``max_shots`` shots are consumed, or when the next chunk would exceed
+    ``time_budget``. The first chunk is always sampled.
+
+    Args:
+        op: An operator of which expectation value is estimated.
+        state: A quantum state on which the operator expectation is evaluated.
+        max_shots: Maximum number of shots available for sampling measurements.
+        chunk_shots: Number of shots sampled in a round.
+        sampler: a :class:`~ConcurrentSampler` that actually performs the sampling.
+        hardware_type: "sc" for super conducting, "it" for iontrap type hardware.
+        measurement_factory: A function that performs Pauli grouping and returns
+            a measurement scheme for Pauli operators constituting the original operator.
+        shots_allocator: A function that allocates the shots budgeted so far to
+            Pauli groups to be measured.
+        target_error: Standard error at which sampling stops.
+        time_budget: Quantum circuit time in seconds available for sampling.
+        shot_time: A function that returns the quantum circuit time of a shot of a
+            given transpiled circuit. Required when ``time_budget`` is given.
+        transpiler: A :class:`~CircuitTranspiler` that transpiles the measurement
+            circuits to the native gates of the hardware. The default transpiler of
+            ``hardware_type`` is used if omitted.
+
+    Returns:
+        The estimated value (can be accessed with :attr:`.value`) with standard error
+        of estimation (can be accessed with :attr:`.error`) and grouped circuit and
+        shots actually consumed.
+
+    Raises:
+        ValueError: If no group could be sampled within ``max_shots``.
+    """
+    if chunk_shots <= 0:
+        raise ValueError("chunk_shots must be positive.")
+    if time_budget is not None and shot_time is None:
+        raise ValueError("shot_time is required when time_budget is given.")
+
+    if transpiler is None:
+        transpiler = _hardware_transpiler(hardware_type)
+
+    if not isinstance(op, Operator):
+        op = Operator({op: 1.0})
+
+    if len(op) == 0:
+        circuit_shots = [(state.circuit, 0)]
+        return _ConstEstimate(0.0), circuit_shots
+
+    const: complex = 0.0
+    if PAULI_IDENTITY in op:
+        const = op[PAULI_IDENTITY]
+        if len(op) == 1:
+            circuit_shots = [(state.circuit, 0)]
+            return _ConstEstimate(const), circuit_shots
+
+    measurements = measurement_factory(op)
+    measurements = [m for m in measurements if m.pauli_set != {PAULI_IDENTITY}]
+    pauli_sets = tuple(m.pauli_set for m in measurements)
+    circuits = [transpiler(state.circuit + m.measurement_circuit) for m in measurements]
+    stats = [_GroupStatistics(op, m) for m in measurements]
+    consumed = [0] * len(measurements)
+    shot_times = (
+        [shot_time(circuit) for circuit in circuits] if shot_time is not None else []
+    )
+
+    total_shots, total_time = 0, 0.0
+    for budget in sequential_shot_budgets(max_shots, chunk_shots):
+        shots_map = {
+            pauli_set: shots
+            for pauli_set, shots in shots_allocator(op, pauli_sets, budget)
+        }
+        chunk_allocation = _chunk_allocation(
+            [shots_map[m.pauli_set] for m in measurements],
+            consumed,
+            budget - total_shots,
+        )
+        chunk = [(i, shots) for i, shots in enumerate(chunk_allocation) if shots > 0]
+        if len(chunk) == 0:
+            continue
+        if time_budget is not None:
+            chunk_time = sum(shot_times[i] * shots for i, shots in chunk)
+            if total_shots > 0 and total_time + chunk_time > time_budget:
+                break
+            total_time += chunk_time
+
+        sampling_counts = _sample_transpiled(
+            sampler, [(circuits[i], shots) for i, shots in chunk], hardware_type
+        )
+        for (i, shots), counts in zip(chunk, sampling_counts):
+            stats[i].update(counts)
+            consumed[i] += shots
+        total_shots += sum(shots for _, shots in chunk)
+
+        if target_error is not None:
+            variance = sum(s.variance_of_mean for s in stats)
+            if np.sqrt(variance) <= target_error:
+                break
+
+    if total_shots == 0:
+        raise ValueError(
+            f"No group was sampled within {max_shots} shots; max_shots must be at "
+            "least 2."
+        )
+    # the error is infinite if a group was sampled less than twice
+    value = const + sum(s.mean for s in stats)
+    error = float(np.sqrt(sum(s.variance_of_mean for s in stats)))
+    circuit_and_shots = [
+        (circuit, shots) for circuit, shots in zip(circuits, consumed) if shots > 0
+    ]
+    return _PlainEstimate(value, error), circuit_and_shots
+
+
+def sequential_shot_budgets(max_shots: int, chunk_shots: int) -> list[int]:
+    """Returns the cumulative shot budgets passed to the shots allocator by
+    :func:`sequential_sampling_estimate_gc` in each round."""
+    budgets = list(range(chunk_shots, max_shots, chunk_shots))
+    return budgets + [max_shots] if max_shots > 0 else budgets
+
+
+def _chunk_allocation(
+    targets: Sequence[int], consumed: Sequence[int], available: int
+) -> list[int]:
+    """Returns the shots of the groups in the next chunk, at most ``available``
+    in total: each group is first brought to 2 shots, in the order of decreasing
+    target, and then towards its target allocation."""
+    target_array = np.array(targets, dtype=np.int64)
+    consumed_array = np.array(consumed, dtype=np.int64)
+    shots = np.zeros_like(consumed_array)
+    for i in np.argsort(-target_array, kind="stable").tolist():
+        need = max(2 - int(consumed_array[i]), 0)
+        if need > available:
+            break
+        shots[i] = need
+        available -= need
+    deficits = np.maximum(target_array - consumed_array - shots, 0)
+    if deficits.sum() > available:
+        deficits = deficits * available // deficits.sum()
+    return [int(n) for n in shots + deficits]
+
+
+def zne_sampling_estimate_gc(
+    op: Estimatable,
+    state: CircuitQuantumState,
+    total_shots: int,
+    sampler: ConcurrentSampler,
+    hardware_type: str,
+    measurement_factory: CommutablePauliSetMeasurementFactory,
+    shots_allocator: PauliSamplingShotsAllocator,
+    scale_factors: Sequence[float],
+    extrapolate_method: "ZeroExtrapolationMethod",
+    folding_method: "FoldingMethod",
+    transpiler: Optional[CircuitTranspiler] = None,
+) -> tuple[Estimate[complex], Iterable[tuple[NonParametricQuantumCircuit, int]]]:
+    """Estimate expectation value of a given operator with a given state by
+    sampling measurement with zero noise extrapolation.
+
+    Pauli grouping, shot allocation and transpilation are done once. The
+    transpiled measurement circuits are then folded at the native gate level with
+    :func:`fold_native_circuit` for each scale factor, and all the scale factors
+    times measurement groups are sampled in a single batch.
+
+    Since the native inverse of a gate may consist of more than one gate (e.g.
+    SX), a folded circuit can have more gates than the nominal scale factor
+    implies. The values are therefore extrapolated against the effective scale
+    factors, i.e. the ratios of the numbers of gates of the folded and the
+    original circuits, averaged over the groups weighted by their shots.
+
+    Args:
+        op: An operator of which expectation value is estimated.
+        state: A quantum state on which the operator expectation is evaluated.
+        total_shots: Total number of shots available for sampling measurements
+            for each scale factor.
+        sampler: a :class:`~ConcurrentSampler` that actually performs the sampling.
+        hardware_type: "sc" for super conducting, "it" for iontrap type hardware.
+        measurement_factory: A function that performs Pauli grouping and returns
+            a measurement scheme for Pauli operators constituting the original operator.
+        shots_allocator: A function that allocates the total shots to Pauli groups to
+            be measured.
+        scale_factors: Factors to scale the circuit. Real numbers that satisfy >= 1.
+        extrapolate_method: :class:`ZeroExtrapolationMethod` that determines the
+            method of extrapolation.
+        folding_method: :class:`FoldingMethod` that determines the method of folding.
+        transpiler: A :class:`~CircuitTranspiler` that transpiles the measurement
+            circuits to the native gates of the hardware. The default transpiler of
+            ``hardware_type`` is used if omitted.
+
+    Returns:
+        The extrapolated value (can be accessed with :attr:`.value`) and the folded
+        circuits and shots actually sampled.
+    """
+    if transpiler is None:
+        transpiler = _hardware_transpiler(hardware_type)
+
+    if not isinstance(op, Operator):
+        op = Operator({op: 1.0})
+
+    if len(op) == 0:
+        circuit_shots = [(state.circuit, total_shots)]
+        return _ConstEstimate(0.0), circuit_shots
+
+    const: complex = 0.0
+    if PAULI_IDENTITY in op:
+        const = op[PAULI_IDENTITY]
+        if len(op) == 1:
+            circuit_shots = [(state.circuit, total_shots)]
+            return _ConstEstimate(const), circuit_shots
+
+    measurements = measurement_factory(op)
+    measurements = [m for m in measurements if m.pauli_set != {PAULI_IDENTITY}]
+
+    pauli_sets = tuple(m.pauli_set for m in measurements)
+    shot_allocs = shots_allocator(op, pauli_sets, total_shots)
+    shots_map = {pauli_set: n_shots for pauli_set, n_shots in shot_allocs}
+    measurements = [m for m in measurements if shots_map[m.pauli_set] > 0]
+    transpiled_circuits = [
+        transpiler(state.circuit + m.measurement_circuit) for m in measurements
+    ]
+
+    from utils.challenge_transpiler import fold_native_circuit
+
+    circuit_and_shots = [
+        (
+            fold_native_circuit(circuit, scale_factor, folding_method),
+            shots_map[m.pauli_set],
+        )
+        for scale_factor in scale_factors
+        for m, circuit in zip(measurements, transpiled_circuits)
+    ]
+    sampling_counts = tuple(
+        _sample_transpiled(sampler, circuit_and_shots, hardware_type)
     )
-    return (
-        _Estimate(op, const, pauli_sets, pauli_recs, tuple(sampling_counts)),
-        circuit_and_shots,
+
+    n_groups = len(measurements)
+    exp_values = [
+        _estimate_from_counts(
+            op,
+            const,
+            measurements,
+            sampling_counts[i * n_groups : (i + 1) * n_groups],  # noqa: E203
+        ).value.real
+        for i in range(len(scale_factors))
+    ]
+    value = extrapolate_method(
+        _effective_scale_factors(scale_factors, transpiled_circuits, circuit_and_shots),
+        exp_values,
     )
+    return _PlainEstimate(value), circuit_and_shots
+
+
+def _effective_scale_factors(
+    scale_factors: Sequence[float],
+    circuits: Sequence[NonParametricQuantumCircuit],
+    folded_circuit_and_shots: Sequence[tuple[NonParametricQuantumCircuit, int]],
+) -> list[float]:
+    """Returns the shot-weighted ratios of the numbers of gates of the folded
+    circuits of each scale factor and of the original circuits."""
+    n_groups = len(circuits)
+    effective = []
+    for i, scale_factor in enumerate(scale_factors):
+        start = i * n_groups
+        folded = folded_circuit_and_shots[start : start + n_groups]  # noqa: E203
+        original_gates = sum(
+            len(circuit.gates) * shots for circuit, (_, shots) in zip(circuits, folded)
+        )
+        folded_gates = sum(len(circuit.gates) * shots for circuit, shots in folded)
+        effective.append(
+            folded_gates / original_gates if original_gates > 0 else scale_factor
+        )
+    return effective
+
+
+def _hardware_transpiler(hardware_type: str) -> CircuitTranspiler:
+    # the transpilers of each hardware type are imported on first use
+    if hardware_type == "sc":
+        from utils.challenge_transpiler import SCSquareLatticeTranspiler
+
+        return SCSquareLatticeTranspiler()
+    elif hardware_type == "it":
+        from quri_parts.quantinuum.circuit.transpile import QuantinuumSetTranspiler
+
+        return QuantinuumSetTranspiler()
+    else:
+        raise NotImplementedError(f"Unsupported hardware_type type: {hardware_type}")
+
+
+def _sample_transpiled(
+    sampler: ConcurrentSampler,
+    circuit_and_shots: Iterable[tuple[NonParametricQuantumCircuit, int]],
+    hardware_type: str,
+) -> Iterable[MeasurementCounts]:
+    if hardware_type == "sc":
+        return sampler(circuit_and_shots)
+
+    from utils.challenge_transpiler import quri_parts_iontrap_native_circuit
+
+    circuit_and_shots_for_it_sampling = [
+        (quri_parts_iontrap_native_circuit(circuit), shots)
+        for (circuit, shots) in circuit_and_shots
+    ]
+    return sampler(circuit_and_shots_for_it_sampling)
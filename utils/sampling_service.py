@@ -0,0 +1,851 @@
+import argparse
+import ipaddress
+import os
+import pickle
+import secrets
+import threading
+from collections import deque
+from collections.abc import Callable, Collection, Iterable, Mapping, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from functools import partial
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional, Union
+
+import numpy as np
+from quri_parts.circuit import QuantumCircuit
+from quri_parts.core.estimator import Estimatable, Estimate
+from quri_parts.core.measurement import (
+    CommutablePauliSetMeasurement,
+    CommutablePauliSetMeasurementFactory,
+)
+from quri_parts.core.operator import PAULI_IDENTITY, CommutablePauliSet, Operator
+from quri_parts.core.sampling import (
+    ConcurrentSampler,
+    MeasurementCounts,
+    PauliSamplingShotsAllocator,
+)
+from quri_parts.core.state import CircuitQuantumState
+
+from utils.challenge_2023 import (
+    ChallengeSampling,
+    QPQiskitCircuit,
+    QPQiskitOperator,
+    TimeExceededError,
+)
+from utils.sampling_estimator import _PlainEstimate, sequential_shot_budgets
+
+#: Environment variable holding the key of the server.
+AUTHKEY_ENV = "QAGC_SAMPLING_AUTHKEY"
+
+#: File holding the key of the server if :data:`AUTHKEY_ENV` is not set.
+DEFAULT_AUTHKEY_FILE = os.path.join("~", ".qagc_sampling_authkey")
+
+if TYPE_CHECKING:
+    from quri_parts.algo.mitigation.zne.zne import (
+        FoldingMethod,
+        ZeroExtrapolationMethod,
+    )
+
+#: Path of a Unix domain socket or (host, port) of a localhost TCP socket.
+Address = Union[str, tuple[str, int]]
+
+#: Result of a job run on a worker: the result, the number of shots and the
+#: quantum circuit time to be charged, which is ``None`` when nothing is charged.
+_JobResult = tuple[Any, int, Optional[float]]
+
+_worker_sampling: Optional[ChallengeSampling] = None
+
+
+def _init_worker(
+    noise: bool, depth_aware_routing: bool, peephole_optimization: bool
+) -> None:
+    global _worker_sampling
+    _worker_sampling = ChallengeSampling(
+        noise, depth_aware_routing, peephole_optimization
+    )
+    # load the transpilers and the simulator, which are imported on first use
+    for hardware_type in ("sc", "it"):
+        _worker_sampling._sample(QuantumCircuit(1), 1, hardware_type)
+
+
+def _warm_up() -> None:
+    pass
+
+
+def _sample_job(*args: Any) -> _JobResult:
+    assert _worker_sampling is not None
+    n_shots = args[1]
+    counts, qc_time = _worker_sampling._sample(*args)
+    return counts, n_shots, qc_time
+
+
+def _sampling_estimate_job(*args: Any) -> _JobResult:
+    assert _worker_sampling is not None
+    n_shots = args[2]
+    estimate, qc_time = _worker_sampling._sampling_estimate(*args)
+    return _PlainEstimate(estimate.value, estimate.error), n_shots, qc_time
+
+
+def _sequential_sampling_estimate_job(*args: Any) -> _JobResult:
+    assert _worker_sampling is not None
+    estimate, n_shots, qc_time = _worker_sampling._sequential_sampling_estimate(
+        *args
+    )
+    return _PlainEstimate(estimate.value, estimate.error), n_shots, qc_time
+
+
+def _zne_sampling_estimate_job(*args: Any) -> _JobResult:
+    assert _worker_sampling is not None
+    estimate, n_shots, qc_time = _worker_sampling._zne_sampling_estimate(*args)
+    return _PlainEstimate(estimate.value, estimate.error), n_shots, qc_time
+
+
+def _classical_shadow_estimate_job(*args: Any) -> _JobResult:
+    assert _worker_sampling is not None
+    n_shots = args[2]
+    estimate, qc_time = _worker_sampling._classical_shadow_estimate(*args)
+    return _PlainEstimate(estimate.value, estimate.error), n_shots, qc_time
+
+
+_jobs: dict[str, Callable[..., _JobResult]] = {
+    "sample": _sample_job,
+    "sampling_estimate": _sampling_estimate_job,
+    "sequential_sampling_estimate": _sequential_sampling_estimate_job,
+    "zne_sampling_estimate": _zne_sampling_estimate_job,
+    "classical_shadow_estimate": _classical_shadow_estimate_job,
+}
+
+
+class _FixedMeasurementFactory:
+    """A :class:`CommutablePauliSetMeasurementFactory` that returns the
+    measurements computed by the client."""
+
+    def __init__(self, measurements: Sequence[CommutablePauliSetMeasurement]):
+        self._measurements = measurements
+
+    def __call__(self, op: Operator) -> Sequence[CommutablePauliSetMeasurement]:
+        return self._measurements
+
+
+class _FixedShotsAllocator:
+    """A :class:`PauliSamplingShotsAllocator` that returns the allocations
+    computed by the client for each number of shots.
+
+    The sequential estimator calls the allocator with the cumulative budget of
+    each round, so there is one allocation per chunk.
+    """
+
+    def __init__(
+        self, allocations: Mapping[int, Collection[tuple[CommutablePauliSet, int]]]
+    ):
+        self._allocations = allocations
+
+    def __call__(
+        self,
+        operator: Operator,
+        pauli_sets: Collection[CommutablePauliSet],
+        total_shots: int,
+    ) -> Collection[tuple[CommutablePauliSet, int]]:
+        return self._allocations[total_shots]
+
+
+def _fixed_measurement(
+    op: Estimatable,
+    measurement_factory: CommutablePauliSetMeasurementFactory,
+    shots_allocator: PauliSamplingShotsAllocator,
+    shot_counts: Iterable[int],
+) -> tuple[_FixedMeasurementFactory, _FixedShotsAllocator]:
+    """Runs the measurement factory and the shots allocator of the client, since
+    they are closures in general, which can not be sent to the server."""
+    if not isinstance(op, Operator):
+        op = Operator({op: 1.0})
+    measurements: list[CommutablePauliSetMeasurement] = []
+    allocations = {}
+    if any(pauli != PAULI_IDENTITY for pauli in op):
+        measurements = [
+            m for m in measurement_factory(op) if m.pauli_set != {PAULI_IDENTITY}
+        ]
+        pauli_sets = tuple(m.pauli_set for m in measurements)
+        allocations = {
+            shots: tuple(shots_allocator(op, pauli_sets, shots))
+            for shots in set(shot_counts)
+        }
+    return _FixedMeasurementFactory(measurements), _FixedShotsAllocator(allocations)
+
+
+class _Batch:
+    """Jobs of a request, which is answered when all of them are finished."""
+
+    def __init__(self, n_jobs: int):
+        self.results: list[Optional[_JobResult]] = [None] * n_jobs
+        self.remaining = n_jobs
+        self.error: Optional[BaseException] = None
+
+
+class _Task(NamedTuple):
+    batch: _Batch
+    position: int
+    job: Callable[..., _JobResult]
+    args: tuple[Any, ...]
+
+
+class _ClientSession:
+    def __init__(self, connection: Connection, account: ChallengeSampling):
+        self.connection = connection
+        #: Only :meth:`ChallengeSampling._add_job` and
+        #: :meth:`ChallengeSampling._check_time` of the account are used.
+        self.account = account
+        self.queue: deque[_Task] = deque()
+        self.closed = False
+        self.send_lock = threading.Lock()
+
+    def totals(self) -> tuple[int, int, float]:
+        return (
+            self.account.total_shots,
+            self.account.total_jobs,
+            self.account.total_quantum_circuit_time,
+        )
+
+
+class SamplingServer:
+    """Local server that runs the sampler and the sampling estimators of
+    :class:`ChallengeSampling` for multiple :class:`ChallengeSamplingClient`
+    processes on a shared pool of worker processes.
+
+    The workers are started and warmed up (transpilers and simulator loaded)
+    before the server accepts clients, and they keep their conversion and
+    routing caches between jobs of all clients. Jobs are scheduled round-robin
+    over the clients, so a client submitting many jobs at once does not delay
+    the jobs of the others by more than one job each.
+
+    Each client connection has its own budget: the jobs of a client are charged
+    to a :class:`ChallengeSampling` of its own with the same rules, and once its
+    budget is exhausted every pending and every later job of the client raises
+    :class:`TimeExceededError`.
+
+    Args:
+        address: Path of a Unix domain socket or (host, port) of a localhost TCP
+            socket.
+        authkey: Key that clients must present to connect. Since the server
+            unpickles the jobs it receives, it does not accept connections without
+            a key.
+        noise: Whether the hardware noise is simulated.
+        max_workers: Number of worker processes. The number of CPUs if omitted.
+        depth_aware_routing: Same as for :class:`ChallengeSampling`.
+        peephole_optimization: Same as for :class:`ChallengeSampling`.
+    """
+
+    def __init__(
+        self,
+        address: Address,
+        authkey: bytes,
+        noise: bool = True,
+        max_workers: Optional[int] = None,
+        depth_aware_routing: bool = False,
+        peephole_optimization: bool = False,
+    ) -> None:
+        if not authkey:
+            raise ValueError("SamplingServer requires a non-empty authkey.")
+        if not isinstance(address, str) and not _is_loopback(address[0]):
+            raise ValueError(
+                f"SamplingServer only listens on loopback addresses, got {address[0]}."
+            )
+        self._config = (noise, depth_aware_routing, peephole_optimization)
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            self._max_workers, initializer=_init_worker, initargs=self._config
+        )
+        # the workers are started before any thread of the server, since they may
+        # be forked
+        wait([self._executor.submit(_warm_up) for _ in range(self._max_workers)])
+
+        self._listener = Listener(address, authkey=authkey)
+        self._condition = threading.Condition()
+        #: Sessions in the round-robin order.
+        self._sessions: deque[_ClientSession] = deque()
+        self._in_flight = 0
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    @property
+    def address(self) -> Address:
+        address: Address = self._listener.address
+        return address
+
+    def serve_forever(self) -> None:
+        """Accepts clients until :meth:`close` is called."""
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                continue
+            except OSError:
+                if self._closed:
+                    return
+                raise
+            session = _ClientSession(connection, ChallengeSampling(*self._config))
+            connection.send(self._config)
+            with self._condition:
+                self._sessions.append(session)
+            threading.Thread(
+                target=self._serve_client, args=(session,), daemon=True
+            ).start()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            sessions = list(self._sessions)
+            self._sessions.clear()
+            self._condition.notify_all()
+        self._listener.close()
+        for session in sessions:
+            session.closed = True
+            session.connection.close()
+        self._executor.shutdown(cancel_futures=True)
+
+    def _serve_client(self, session: _ClientSession) -> None:
+        while True:
+            try:
+                method, args = session.connection.recv()
+            except (EOFError, OSError):
+                break
+            except Exception as e:
+                # e.g. a function of the client which can not be unpickled here
+                self._send(session, ("error", e, session.totals()))
+                continue
+
+            if method == "jobs":
+                self._submit(session, args)
+            elif method == "reset":
+                with self._condition:
+                    session.account.reset()
+                self._send(session, ("ok", None, session.totals()))
+            else:
+                error = ValueError(f"Unknown method: {method}")
+                self._send(session, ("error", error, session.totals()))
+
+        with self._condition:
+            session.closed = True
+            session.queue.clear()
+            if session in self._sessions:
+                self._sessions.remove(session)
+        session.connection.close()
+
+    def _submit(
+        self, session: _ClientSession, jobs: Sequence[tuple[str, tuple[Any, ...]]]
+    ) -> None:
+        if len(jobs) == 0:
+            self._send(session, ("ok", [], session.totals()))
+            return
+        unknown = [name for name, _ in jobs if name not in _jobs]
+        if unknown:
+            error = ValueError(f"Unknown job: {unknown[0]}")
+            self._send(session, ("error", error, session.totals()))
+            return
+        batch = _Batch(len(jobs))
+        with self._condition:
+            for position, (name, args) in enumerate(jobs):
+                session.queue.append(_Task(batch, position, _jobs[name], args))
+            self._condition.notify_all()
+
+    def _next_task(self) -> Optional[tuple[_ClientSession, _Task]]:
+        for _ in range(len(self._sessions)):
+            session = self._sessions[0]
+            self._sessions.rotate(-1)
+            if session.queue:
+                return session, session.queue.popleft()
+        return None
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._condition:
+                next_task = None
+                while not self._closed:
+                    if self._in_flight < self._max_workers:
+                        next_task = self._next_task()
+                        if next_task is not None:
+                            break
+                    self._condition.wait()
+                if next_task is None:
+                    return
+                session, task = next_task
+                self._in_flight += 1
+
+                error: Optional[BaseException] = None
+                skip = task.batch.error is not None
+                if not skip:
+                    try:
+                        session.account._check_time()
+                    except TimeExceededError as e:
+                        error, skip = e, True
+
+            if skip:
+                self._finish_task(session, task, None, error)
+                continue
+            try:
+                future = self._executor.submit(task.job, *task.args)
+            except RuntimeError as e:
+                # the executor is shut down
+                self._finish_task(session, task, None, e)
+                continue
+            future.add_done_callback(partial(self._on_done, session, task))
+
+    def _on_done(
+        self, session: _ClientSession, task: _Task, future: "Future[_JobResult]"
+    ) -> None:
+        try:
+            result = future.result()
+        except BaseException as e:
+            self._finish_task(session, task, None, e)
+        else:
+            self._finish_task(session, task, result, None)
+
+    def _finish_task(
+        self,
+        session: _ClientSession,
+        task: _Task,
+        result: Optional[_JobResult],
+        error: Optional[BaseException],
+    ) -> None:
+        batch = task.batch
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+            batch.results[task.position] = result
+            if batch.error is None:
+                batch.error = error
+            batch.remaining -= 1
+            if batch.remaining > 0:
+                return
+            reply = self._charge(session, batch)
+        self._send(session, reply)
+
+    def _charge(self, session: _ClientSession, batch: _Batch) -> tuple[Any, ...]:
+        """Charges the finished jobs of a batch in order, including those of a
+        failed batch, and returns the reply to the client."""
+        error = batch.error
+        for result in batch.results:
+            if result is None:
+                continue
+            _, n_shots, qc_time = result
+            if qc_time is None:
+                continue
+            try:
+                session.account._add_job(n_shots, qc_time)
+            except TimeExceededError as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            return ("error", error, session.totals())
+        return ("ok", batch.results, session.totals())
+
+    def _send(self, session: _ClientSession, reply: tuple[Any, ...]) -> None:
+        with session.send_lock:
+            if session.closed:
+                return
+            try:
+                session.connection.send(reply)
+            except (pickle.PicklingError, AttributeError, TypeError):
+                status, error, totals = reply
+                session.connection.send((status, RuntimeError(repr(error)), totals))
+            except OSError:
+                session.closed = True
+
+
+class ChallengeSamplingClient(ChallengeSampling):
+    """Drop-in replacement of :class:`ChallengeSampling` whose sampler and
+    estimators run on a :class:`SamplingServer`.
+
+    The hardware settings are those of the server, and the jobs are charged by
+    the server: :attr:`total_shots`, :attr:`total_jobs` and
+    :attr:`total_quantum_circuit_time` are updated with every reply, and
+    :class:`TimeExceededError` is raised by the server once the budget of this
+    client is exhausted.
+
+    Circuits and operators are converted, and the measurement factory and the
+    shots allocator are run, in the client, so that they need not be sent to the
+    server. The concurrent sampler and the concurrent estimators submit all the
+    jobs at once, so they run in parallel on the workers of the server. The
+    folding and extrapolation methods of the ZNE estimators are sent to the
+    server and must be picklable, e.g. functions defined at module level in a
+    module that the server can import.
+
+    Args:
+        address: Address of the server.
+        authkey: Key of the server. If omitted, it is read from the environment
+            variable ``QAGC_SAMPLING_AUTHKEY`` or else from the file
+            ``~/.qagc_sampling_authkey`` written by the server.
+    """
+
+    def __init__(self, address: Address, authkey: Optional[bytes] = None) -> None:
+        if authkey is None:
+            authkey = read_authkey()
+        self._connection = Client(address, authkey=authkey)
+        self._connection_lock = threading.Lock()
+        noise, depth_aware_routing, peephole_optimization = self._connection.recv()
+        super().__init__(noise, depth_aware_routing, peephole_optimization)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def reset(self) -> None:
+        super().reset()
+        self._request("reset", ())
+
+    def create_concurrent_sampler(self, hardware_type: str) -> ConcurrentSampler:
+        """Returns a :class:`~ConcurrentSampler` which runs the given circuits
+        in parallel on the server."""
+
+        def sampling(
+            shot_circuit_pairs: Iterable[tuple[QPQiskitCircuit, int]]
+        ) -> Iterable[MeasurementCounts]:
+            jobs = [
+                (
+                    "sample",
+                    (self._conversion_cache.circuit(circuit), n_shots, hardware_type),
+                )
+                for circuit, n_shots in shot_circuit_pairs
+            ]
+            return [counts for counts, _, _ in self._run_jobs(jobs)]
+
+        return sampling
+
+    def concurrent_sampling_estimator(
+        self,
+        operators: Collection[Estimatable],
+        states: Collection[CircuitQuantumState],
+        total_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+    ) -> Iterable[Estimate[complex]]:
+        """Estimate expectation value of given operators with given states by
+        sampling measurement. The estimations run in parallel on the server.
+
+        The arguments are the same as
+        :meth:`ChallengeSampling.concurrent_sampling_estimator`.
+        """
+        num_ops = len(operators)
+        num_states = len(states)
+
+        if num_ops == 0:
+            raise ValueError("No operator specified.")
+
+        if num_states == 0:
+            raise ValueError("No state specified.")
+
+        if num_ops > 1 and num_states > 1 and num_ops != num_states:
+            raise ValueError(
+                f"Number of operators ({num_ops}) does not match"
+                f"number of states ({num_states})."
+            )
+
+        if num_states == 1:
+            states = [next(iter(states))] * num_ops
+        if num_ops == 1:
+            operators = [next(iter(operators))] * num_states
+        jobs = [
+            self._sampling_estimate_job(
+                op,
+                state,
+                total_shots,
+                measurement_factory,
+                shots_allocator,
+                hardware_type,
+            )
+            for op, state in zip(operators, states)
+        ]
+        return [
+            estimate.value.real if qc_time is None else estimate
+            for estimate, _, qc_time in self._run_jobs(jobs)
+        ]
+
+    def _request(self, method: str, args: Any) -> Any:
+        with self._connection_lock:
+            try:
+                self._connection.send((method, args))
+            except (pickle.PicklingError, AttributeError, TypeError) as e:
+                raise TypeError(
+                    "The arguments can not be sent to the sampling server. Functions "
+                    "must be defined at module level in a module that the server "
+                    "can import."
+                ) from e
+            status, result, totals = self._connection.recv()
+        self.total_shots, self.total_jobs, self.total_quantum_circuit_time = totals
+        if status == "error":
+            raise result
+        return result
+
+    def _run_jobs(
+        self, jobs: Sequence[tuple[str, tuple[Any, ...]]]
+    ) -> list[_JobResult]:
+        result: list[_JobResult] = self._request("jobs", jobs)
+        return result
+
+    def _add_job(self, n_shots: int, qc_time: float) -> None:
+        """Does nothing, since the jobs are charged by the server."""
+
+    def _sample(
+        self,
+        circuit: QPQiskitCircuit,
+        n_shots: int,
+        hardware_type: str,
+    ) -> tuple[MeasurementCounts, float]:
+        circuit = self._conversion_cache.circuit(circuit)
+        ((counts, _, qc_time),) = self._run_jobs(
+            [("sample", (circuit, n_shots, hardware_type))]
+        )
+        assert qc_time is not None
+        return counts, qc_time
+
+    def _sampling_estimate_job(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+    ) -> tuple[str, tuple[Any, ...]]:
+        operator = self._conversion_cache.operator(operator)
+        circuit = self._state_circuit(state_or_circuit)
+        fixed_factory, fixed_allocator = _fixed_measurement(
+            operator, measurement_factory, shots_allocator, [n_shots]
+        )
+        return "sampling_estimate", (
+            operator,
+            circuit,
+            n_shots,
+            fixed_factory,
+            fixed_allocator,
+            hardware_type,
+        )
+
+    def _sampling_estimate(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+    ) -> tuple[Estimate[complex], Optional[float]]:
+        job = self._sampling_estimate_job(
+            operator,
+            state_or_circuit,
+            n_shots,
+            measurement_factory,
+            shots_allocator,
+            hardware_type,
+        )
+        ((estimate, _, qc_time),) = self._run_jobs([job])
+        return estimate, qc_time
+
+    def _sequential_sampling_estimate(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        max_shots: int,
+        chunk_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        target_error: Optional[float],
+        time_budget: Optional[float],
+    ) -> tuple[Estimate[complex], int, Optional[float]]:
+        operator = self._conversion_cache.operator(operator)
+        circuit = self._state_circuit(state_or_circuit)
+        # the allocator is called with a different budget in every round, so that
+        # a randomized allocator draws a new allocation for every chunk as it does
+        # locally
+        shot_counts = (
+            sequential_shot_budgets(max_shots, chunk_shots) if chunk_shots > 0 else []
+        )
+        fixed_factory, fixed_allocator = _fixed_measurement(
+            operator, measurement_factory, shots_allocator, shot_counts
+        )
+        ((estimate, n_shots, qc_time),) = self._run_jobs(
+            [
+                (
+                    "sequential_sampling_estimate",
+                    (
+                        operator,
+                        circuit,
+                        max_shots,
+                        chunk_shots,
+                        fixed_factory,
+                        fixed_allocator,
+                        hardware_type,
+                        target_error,
+                        time_budget,
+                    ),
+                )
+            ]
+        )
+        return estimate, n_shots, qc_time
+
+    def _zne_sampling_estimate(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        measurement_factory: CommutablePauliSetMeasurementFactory,
+        shots_allocator: PauliSamplingShotsAllocator,
+        hardware_type: str,
+        scale_factors: Sequence[float],
+        extrapolate_method: "ZeroExtrapolationMethod",
+        folding_method: "FoldingMethod",
+    ) -> tuple[Estimate[complex], int, Optional[float]]:
+        operator = self._conversion_cache.operator(operator)
+        circuit = self._state_circuit(state_or_circuit)
+        fixed_factory, fixed_allocator = _fixed_measurement(
+            operator, measurement_factory, shots_allocator, [n_shots]
+        )
+        ((estimate, total_shots, qc_time),) = self._run_jobs(
+            [
+                (
+                    "zne_sampling_estimate",
+                    (
+                        operator,
+                        circuit,
+                        n_shots,
+                        fixed_factory,
+                        fixed_allocator,
+                        hardware_type,
+                        scale_factors,
+                        extrapolate_method,
+                        folding_method,
+                    ),
+                )
+            ]
+        )
+        return estimate, total_shots, qc_time
+
+    def _classical_shadow_estimate(
+        self,
+        operator: QPQiskitOperator,
+        state_or_circuit: Union[CircuitQuantumState, QPQiskitCircuit],
+        n_shots: int,
+        n_bases: int,
+        hardware_type: str,
+        n_groups: int,
+        seed: Union[None, int, np.random.Generator],
+    ) -> tuple[Estimate[complex], Optional[float]]:
+        operator = self._conversion_cache.operator(operator)
+        circuit = self._state_circuit(state_or_circuit)
+        # the seed of the server is drawn here, so that a generator of the client
+        # advances with every estimation
+        server_seed = int(np.random.default_rng(seed).integers(2**63))
+        ((estimate, _, qc_time),) = self._run_jobs(
+            [
+                (
+                    "classical_shadow_estimate",
+                    (
+                        operator,
+                        circuit,
+                        n_shots,
+                        n_bases,
+                        hardware_type,
+                        n_groups,
+                        server_seed,
+                    ),
+                )
+            ]
+        )
+        return estimate, qc_time
+
+
+def read_authkey(authkey_file: str = DEFAULT_AUTHKEY_FILE) -> bytes:
+    """Returns the key of the server from the environment variable
+    ``QAGC_SAMPLING_AUTHKEY`` or else from ``authkey_file``."""
+    authkey = os.environ.get(AUTHKEY_ENV)
+    if authkey is None:
+        with open(os.path.expanduser(authkey_file)) as f:
+            authkey = f.read().strip()
+    return authkey.encode()
+
+
+def _write_authkey(authkey_file: str) -> bytes:
+    authkey = secrets.token_hex(32)
+    path = os.path.expanduser(authkey_file)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        # the mode of open only applies to a new file
+        os.fchmod(f.fileno(), 0o600)
+        f.write(authkey)
+    return authkey.encode()
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def _parse_address(address: str) -> Address:
+    """Parses ``host:port`` of a loopback address, or else the path of a Unix
+    domain socket."""
+    host, _, port = address.rpartition(":")
+    if not (host and port.isdigit()):
+        return address
+    if not _is_loopback(host):
+        raise ValueError(
+            f"The server only listens on loopback addresses, got {host}. Use a "
+            "Unix domain socket or localhost."
+        )
+    return host.strip("[]"), int(port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Runs a local sampling server for ChallengeSamplingClient."
+    )
+    parser.add_argument(
+        "address", help="path of a Unix domain socket, or host:port on localhost"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--noise", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--depth-aware-routing", action="store_true")
+    parser.add_argument("--peephole-optimization", action="store_true")
+    parser.add_argument(
+        "--authkey-file",
+        default=DEFAULT_AUTHKEY_FILE,
+        help="file (mode 0600) to which a random key is written if "
+        f"{AUTHKEY_ENV} is not set",
+    )
+    args = parser.parse_args()
+    try:
+        address = _parse_address(args.address)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # the key is read from the environment so that it does not show up in ps
+    if os.environ.get(AUTHKEY_ENV):
+        authkey = read_authkey()
+    else:
+        authkey = _write_authkey(args.authkey_file)
+        print(f"Wrote a random authkey to {args.authkey_file}")
+    server = SamplingServer(
+        address,
+        authkey=authkey,
+        noise=args.noise,
+        max_workers=args.workers,
+        depth_aware_routing=args.depth_aware_routing,
+        peephole_optimization=args.peephole_optimization,
+    )
+    print(f"Serving on {server.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
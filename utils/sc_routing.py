@@ -0,0 +1,455 @@
+import math
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from typing import Hashable, NamedTuple, Optional
+
+from quri_parts.circuit import (
+    SWAP,
+    NonParametricQuantumCircuit,
+    QuantumCircuit,
+    QuantumGate,
+    gate_names,
+)
+from quri_parts.circuit.transpile import CircuitTranspilerProtocol
+
+#: Number of native layers a gate occupies after decomposition, used to estimate
+#: the depth while routing. SWAP is decomposed into three CNOTs and CZ into
+#: H CNOT H, with H being RZ SX RZ.
+_SWAP_LAYERS = 3
+_CZ_LAYERS = 7
+
+#: A routed gate: index of the gate in the input circuit (-1 for an inserted
+#: SWAP) with its target and control indices on the output circuit.
+_RoutedGate = tuple[int, tuple[int, ...], tuple[int, ...]]
+
+
+class _Routing(NamedTuple):
+    gates: list[tuple[int, tuple[int, ...], tuple[int, ...]]]
+    depth: int
+    final_layout: dict[int, int]
+
+
+_layout_cache: "OrderedDict[Hashable, tuple[_RoutedGate, ...]]" = OrderedDict()
+_LAYOUT_CACHE_SIZE = 1024
+_layout_cache_lock = threading.Lock()
+
+
+class DepthAwareSquareLatticeRouter(CircuitTranspilerProtocol):
+    """CircuitTranspiler, which places the qubits of a circuit on a square
+    lattice and inserts SWAP gates so that every two-qubit gate acts on adjacent
+    qubits, minimizing the depth of the resulting circuit.
+
+    Compared to :class:`SquareLatticeSWAPInsertionTranspiler`, which places qubit
+    ``i`` on lattice site ``i`` and swaps qubits back after every distant gate,
+
+    * the qubits are placed on a compact block of the lattice chosen, together
+      with the initial layout, from the interaction graph of the circuit,
+    * the SWAPs are chosen by a lookahead heuristic on the front layer and the
+      following two-qubit gates, preferring SWAPs on idle qubits, and
+    * the qubits are not swapped back: since every qubit starts in
+      :math:`|0\\rangle`, the output qubit ``i`` is the lattice site on which
+      logical qubit ``i`` ends, so that measured bits keep their meaning.
+
+    Routings are cached by the structure of the circuit (gate names and
+    indices, without parameters) up to the last two-qubit gate of each qubit, so
+    the optimization is paid once per ansatz and is shared by its measurement
+    circuits.
+
+    The input circuit must not contain gates acting on more than two qubits.
+
+    Args:
+        xsize: Size of lattice in x direction.
+        ysize: Size of lattice in y direction.
+        lookahead: Number of two-qubit gates following the front layer that are
+            taken into account when choosing a SWAP.
+        lookahead_weight: Weight of the lookahead gates relative to the front layer.
+    """
+
+    def __init__(
+        self,
+        xsize: int = 8,
+        ysize: int = 8,
+        lookahead: int = 20,
+        lookahead_weight: float = 0.5,
+    ):
+        self._xsize = xsize
+        self._ysize = ysize
+        self._lookahead = lookahead
+        self._lookahead_weight = lookahead_weight
+
+    def __call__(
+        self, circuit: NonParametricQuantumCircuit
+    ) -> NonParametricQuantumCircuit:
+        # single-qubit gates after the last two-qubit gate on their qubit, such as
+        # the basis changes of measurement circuits, do not affect the routing and
+        # keep their indices after relabeling, so that they are excluded from the
+        # routing and its cache key
+        body: list[QuantumGate] = []
+        trailing: list[QuantumGate] = []
+        entangled: set[int] = set()
+        for gate in reversed(circuit.gates):
+            qubits = set(gate.target_indices) | set(gate.control_indices)
+            if len(qubits) > 1 or qubits & entangled:
+                body.append(gate)
+                entangled |= qubits
+            else:
+                trailing.append(gate)
+        body.reverse()
+        trailing.reverse()
+
+        key = (
+            self._xsize,
+            self._ysize,
+            self._lookahead,
+            self._lookahead_weight,
+            circuit.qubit_count,
+            tuple(
+                (gate.name, gate.target_indices, gate.control_indices)
+                for gate in body
+            ),
+        )
+        with _layout_cache_lock:
+            routed_gates = _layout_cache.get(key)
+            if routed_gates is not None:
+                _layout_cache.move_to_end(key)
+        if routed_gates is None:
+            # routed outside of the lock, so that other threads are not blocked
+            routed_gates = self._route_best(body, circuit.qubit_count)
+            with _layout_cache_lock:
+                _layout_cache[key] = routed_gates
+                if len(_layout_cache) > _LAYOUT_CACHE_SIZE:
+                    _layout_cache.popitem(last=False)
+
+        routed = QuantumCircuit(circuit.qubit_count)
+        for index, targets, controls in routed_gates:
+            if index < 0:
+                routed.add_gate(SWAP(*targets))
+            else:
+                routed.add_gate(
+                    body[index]._replace(
+                        target_indices=targets, control_indices=controls
+                    )
+                )
+        routed.extend(trailing)
+        return routed
+
+    def _route_best(
+        self, gates: Sequence[QuantumGate], qubit_count: int
+    ) -> tuple[_RoutedGate, ...]:
+        for gate in gates:
+            if len(gate.target_indices) + len(gate.control_indices) > 2:
+                raise ValueError(
+                    "Gates acting on more than two qubits are not supported: "
+                    f"{gate.name}"
+                )
+        if qubit_count > self._xsize * self._ysize:
+            raise ValueError(
+                f"{qubit_count} qubits do not fit in the "
+                f"{self._xsize}x{self._ysize} lattice."
+            )
+        weights = _interaction_weights(gates, qubit_count)
+
+        best: Optional[_Routing] = None
+        for region in self._regions(qubit_count):
+            distance, neighbors = _region_distance(region, self._xsize)
+            layouts = [
+                dict(zip(range(qubit_count), region)),
+                _place(weights, region, distance),
+            ]
+            for layout in layouts:
+                routing = self._route(gates, qubit_count, layout, distance, neighbors)
+                # a backward pass from the final layout gives an initial layout that
+                # suits the beginning of the circuit (SABRE)
+                backward = self._route(
+                    gates[::-1], qubit_count, routing.final_layout, distance, neighbors
+                )
+                refined = self._route(
+                    gates, qubit_count, backward.final_layout, distance, neighbors
+                )
+                for candidate in (routing, refined):
+                    if best is None or candidate.depth < best.depth:
+                        best = candidate
+        assert best is not None
+
+        # relabel the lattice sites with the logical qubits ending on them
+        label = {site: qubit for qubit, site in best.final_layout.items()}
+        return tuple(
+            (
+                index,
+                tuple(label[s] for s in targets),
+                tuple(label[s] for s in controls),
+            )
+            for index, targets, controls in best.gates
+        )
+
+    def _regions(self, qubit_count: int) -> list[list[int]]:
+        """Returns compact blocks of lattice sites to place the qubits on: the
+        first ``qubit_count`` sites in row-major order of w x h rectangles."""
+        regions = []
+        for width in range(1, self._xsize + 1):
+            for height in range(1, self._ysize + 1):
+                excess = width * height - qubit_count
+                if excess < 0 or excess >= min(width, height):
+                    continue
+                sites = [x + self._xsize * y for y in range(height) for x in range(width)]
+                regions.append(sites[:qubit_count])
+        return regions
+
+    def _route(
+        self,
+        gates: Sequence[QuantumGate],
+        qubit_count: int,
+        layout: dict[int, int],
+        distance: dict[int, dict[int, int]],
+        neighbors: dict[int, list[int]],
+    ) -> _Routing:
+        position = dict(layout)
+        occupant = {site: qubit for qubit, site in position.items()}
+        time = {site: 0 for site in occupant}
+        decay = {site: 1.0 for site in occupant}
+
+        qubits = [tuple(g.control_indices) + tuple(g.target_indices) for g in gates]
+        successors: list[list[int]] = [[] for _ in gates]
+        n_predecessors = [0] * len(gates)
+        last: dict[int, int] = {}
+        for i, qs in enumerate(qubits):
+            for q in set(qs):
+                if q in last:
+                    successors[last[q]].append(i)
+                    n_predecessors[i] += 1
+                last[q] = i
+        front = [i for i in range(len(gates)) if n_predecessors[i] == 0]
+
+        routed: list[_RoutedGate] = []
+        swaps_since_progress = 0
+        while front:
+            progress = True
+            while progress:
+                progress = False
+                for i in list(front):
+                    qs = qubits[i]
+                    if len(qs) == 2 and distance[position[qs[0]]][position[qs[1]]] > 1:
+                        continue
+                    front.remove(i)
+                    progress = True
+                    gate = gates[i]
+                    if gate.name == gate_names.SWAP:
+                        # a logical SWAP only exchanges the layout
+                        a, b = gate.target_indices
+                        position[a], position[b] = position[b], position[a]
+                        occupant[position[a]], occupant[position[b]] = a, b
+                    else:
+                        sites = [position[q] for q in qs]
+                        start = max(time[s] for s in sites)
+                        layers = _CZ_LAYERS if gate.name == gate_names.CZ else 1
+                        for s in sites:
+                            time[s] = start + layers
+                        routed.append(
+                            (
+                                i,
+                                tuple(position[q] for q in gate.target_indices),
+                                tuple(position[q] for q in gate.control_indices),
+                            )
+                        )
+                    for j in successors[i]:
+                        n_predecessors[j] -= 1
+                        if n_predecessors[j] == 0:
+                            front.append(j)
+            if not front:
+                break
+            swaps_since_progress = 0 if progress else swaps_since_progress
+            for site in decay:
+                decay[site] = 1.0
+
+            if swaps_since_progress > 4 * qubit_count:
+                # release valve: bring the closest pair together along a shortest path
+                i = min(
+                    front,
+                    key=lambda i: distance[position[qubits[i][0]]][
+                        position[qubits[i][1]]
+                    ],
+                )
+                a, b = position[qubits[i][0]], position[qubits[i][1]]
+                nxt = min(neighbors[a], key=lambda s: distance[s][b])
+                self._swap(a, nxt, position, occupant, time, routed)
+                continue
+
+            extended = self._extended_set(front, successors, qubits, n_predecessors)
+            makespan = max(time.values())
+            candidates = {
+                (min(site, nb), max(site, nb))
+                for i in front
+                for q in qubits[i]
+                for site in (position[q],)
+                for nb in neighbors[site]
+            }
+            best_swap, best_score = None, math.inf
+            for a, b in sorted(candidates):
+                qa, qb = occupant[a], occupant[b]
+
+                def moved(q: int) -> int:
+                    return b if q == qa else a if q == qb else position[q]
+
+                h = sum(
+                    distance[moved(qubits[i][0])][moved(qubits[i][1])] for i in front
+                ) / len(front)
+                if extended:
+                    h += (
+                        self._lookahead_weight
+                        * sum(
+                            distance[moved(qubits[i][0])][moved(qubits[i][1])]
+                            for i in extended
+                        )
+                        / len(extended)
+                    )
+                start = max(time[a], time[b])
+                idle_penalty = max(0, start + _SWAP_LAYERS - makespan) / _SWAP_LAYERS
+                score = max(decay[a], decay[b]) * h + 0.5 * idle_penalty
+                if score < best_score:
+                    best_swap, best_score = (a, b), score
+            assert best_swap is not None
+            a, b = best_swap
+            self._swap(a, b, position, occupant, time, routed)
+            decay[a] += 0.001
+            decay[b] += 0.001
+            swaps_since_progress += 1
+
+        depth = max(time.values()) if time else 0
+        return _Routing(routed, depth, position)
+
+    def _extended_set(
+        self,
+        front: list[int],
+        successors: list[list[int]],
+        qubits: list[tuple[int, ...]],
+        n_predecessors: list[int],
+    ) -> list[int]:
+        extended: list[int] = []
+        remaining = list(n_predecessors)
+        queue = deque(front)
+        while queue and len(extended) < self._lookahead:
+            i = queue.popleft()
+            for j in successors[i]:
+                remaining[j] -= 1
+                if remaining[j] == 0:
+                    queue.append(j)
+                    if len(qubits[j]) == 2:
+                        extended.append(j)
+        return extended
+
+    @staticmethod
+    def _swap(
+        a: int,
+        b: int,
+        position: dict[int, int],
+        occupant: dict[int, int],
+        time: dict[int, int],
+        routed: list[_RoutedGate],
+    ) -> None:
+        qa, qb = occupant[a], occupant[b]
+        position[qa], position[qb] = b, a
+        occupant[a], occupant[b] = qb, qa
+        time[a] = time[b] = max(time[a], time[b]) + _SWAP_LAYERS
+        routed.append((-1, (a, b), ()))
+
+
+def _interaction_weights(
+    gates: Sequence[QuantumGate], qubit_count: int
+) -> dict[tuple[int, int], float]:
+    """Returns the weights of the interaction graph, in which earlier two-qubit
+    gates weigh more since the layout changes as the circuit is routed."""
+    weights: dict[tuple[int, int], float] = {}
+    k = 0
+    for gate in gates:
+        qs = tuple(gate.control_indices) + tuple(gate.target_indices)
+        if len(qs) != 2:
+            continue
+        pair = (min(qs), max(qs))
+        weights[pair] = weights.get(pair, 0.0) + math.exp(-k / (2 * qubit_count))
+        k += 1
+    return weights
+
+
+def _region_distance(
+    region: Sequence[int], xsize: int
+) -> tuple[dict[int, dict[int, int]], dict[int, list[int]]]:
+    """Returns the distances between the sites of a region along paths within the
+    region, and the neighbors of each site."""
+    sites = set(region)
+    neighbors: dict[int, list[int]] = {}
+    for site in region:
+        x, y = site % xsize, site // xsize
+        neighbors[site] = [
+            nx + xsize * ny
+            for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+            if 0 <= nx < xsize and ny >= 0 and nx + xsize * ny in sites
+        ]
+    distance: dict[int, dict[int, int]] = {}
+    for source in region:
+        dist = {source: 0}
+        queue = deque([source])
+        while queue:
+            site = queue.popleft()
+            for nb in neighbors[site]:
+                if nb not in dist:
+                    dist[nb] = dist[site] + 1
+                    queue.append(nb)
+        distance[source] = dist
+    return distance, neighbors
+
+
+def _place(
+    weights: dict[tuple[int, int], float],
+    region: Sequence[int],
+    distance: dict[int, dict[int, int]],
+) -> dict[int, int]:
+    """Places qubits on a region so that strongly interacting qubits are close:
+    greedily from the most connected qubit on the most central site, then improved
+    by exchanging pairs of qubits."""
+    qubit_count = len(region)
+    adjacency: dict[int, dict[int, float]] = {q: {} for q in range(qubit_count)}
+    for (a, b), w in weights.items():
+        adjacency[a][b] = w
+        adjacency[b][a] = w
+
+    def cost(layout: dict[int, int]) -> float:
+        return sum(w * distance[layout[a]][layout[b]] for (a, b), w in weights.items())
+
+    layout: dict[int, int] = {}
+    free = list(region)
+    strength = {q: sum(adjacency[q].values()) for q in range(qubit_count)}
+    while len(layout) < qubit_count:
+        unplaced = [q for q in range(qubit_count) if q not in layout]
+        qubit = max(
+            unplaced,
+            key=lambda q: (sum(adjacency[q].get(p, 0.0) for p in layout), strength[q]),
+        )
+        site = min(
+            free,
+            key=lambda s: (
+                sum(
+                    w * distance[s][layout[p]]
+                    for p, w in adjacency[qubit].items()
+                    if p in layout
+                ),
+                sum(distance[s].values()),
+            ),
+        )
+        layout[qubit] = site
+        free.remove(site)
+
+    current = cost(layout)
+    improved = True
+    while improved:
+        improved = False
+        for a in range(qubit_count):
+            for b in range(a + 1, qubit_count):
+                layout[a], layout[b] = layout[b], layout[a]
+                new = cost(layout)
+                if new < current - 1e-12:
+                    current = new
+                    improved = True
+                else:
+                    layout[a], layout[b] = layout[b], layout[a]
+    return layout